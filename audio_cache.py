@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+import shlex
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class AudioCache:
+    def __init__(self, directory: str = "cache/audio", max_bytes: int = 2 * 1024 ** 3, policy: str = "lru",
+                 min_plays: int = 2, bitrate: str = "128k", max_fills: int = 2):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown audio cache policy: {policy}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.min_plays = min_plays
+        self.bitrate = bitrate
+
+        # track id -> [size in bytes (None until the file is complete), plays, last played]
+        self._entries: Dict[str, List] = {}
+        self._filling = set()
+        self._fill_semaphore = asyncio.Semaphore(max_fills)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'fills': 0,
+            'failed_fills': 0,
+            'evictions': 0,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                track_id TEXT PRIMARY KEY,
+                size INTEGER,
+                plays INTEGER NOT NULL,
+                last_played REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def path(self, track_id: str) -> str:
+        name = hashlib.sha1(track_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.opus")
+
+    def _load(self):
+        with self._lock:
+            # Forget play counts of tracks that never made it into the cache.
+            self._db.execute("DELETE FROM entries WHERE size IS NULL AND last_played < ?", (time.time() - 30 * 86400,))
+            self._db.commit()
+            rows = self._db.execute("SELECT track_id, size, plays, last_played FROM entries").fetchall()
+        entries = {}
+        for track_id, size, plays, last_played in rows:
+            if size is not None and not os.path.exists(self.path(track_id)):
+                size = None
+            entries[track_id] = [size, plays, last_played]
+        return entries
+
+    def _persist(self, track_id: str, entry: Optional[List]):
+        with self._lock:
+            if entry is None:
+                self._db.execute("DELETE FROM entries WHERE track_id = ?", (track_id,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (track_id, *entry))
+            self._db.commit()
+
+    async def load(self):
+        self._entries = await asyncio.to_thread(self._load)
+        self.total_bytes = sum(entry[0] for entry in self._entries.values() if entry[0])
+        await self._evict()
+
+    def contains(self, track_id: str) -> bool:
+        entry = self._entries.get(track_id)
+        return entry is not None and entry[0] is not None
+
+    async def lookup(self, track_id: str) -> Optional[str]:
+        if not self.contains(track_id):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        entry = self._entries[track_id]
+        entry[2] = time.time()
+        await asyncio.to_thread(self._persist, track_id, list(entry))
+        return self.path(track_id)
+
+    async def record_play(self, track_id: str) -> bool:
+        entry = self._entries.setdefault(track_id, [None, 0, 0])
+        entry[1] += 1
+        entry[2] = time.time()
+        await asyncio.to_thread(self._persist, track_id, list(entry))
+        return entry[0] is None and entry[1] >= self.min_plays and track_id not in self._filling
+
+    async def fill(self, track_id: str, stream_url: str, before_options: str = ""):
+        if self.contains(track_id) or track_id in self._filling:
+            return
+        self._filling.add(track_id)
+        path = self.path(track_id)
+        tmp_path = f"{path}.part"
+        try:
+            async with self._fill_semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    *shlex.split(before_options), "-i", stream_url,
+                    "-vn", "-c:a", "libopus", "-b:a", self.bitrate, "-f", "ogg", tmp_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+            if process.returncode != 0:
+                self.stats['failed_fills'] += 1
+                print(f"Audio cache fill failed for {track_id}: {stderr.decode(errors='replace').strip()}")
+                return
+
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            entry = self._entries.setdefault(track_id, [None, 0, time.time()])
+            entry[0] = size
+            self.total_bytes += size
+            self.stats['fills'] += 1
+            await asyncio.to_thread(self._persist, track_id, list(entry))
+            await self._evict()
+        finally:
+            self._filling.discard(track_id)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            cached = [(track_id, entry) for track_id, entry in self._entries.items() if entry[0] is not None]
+            if not cached:
+                break
+            if self.policy == "lfu":
+                track_id, entry = min(cached, key=lambda item: (item[1][1], item[1][2]))
+            else:
+                track_id, entry = min(cached, key=lambda item: item[1][2])
+
+            self.total_bytes -= entry[0]
+            entry[0] = None
+            self.stats['evictions'] += 1
+            # Playing FFmpeg processes keep their open handle to the file.
+            try:
+                os.remove(self.path(track_id))
+            except FileNotFoundError:
+                pass
+            await asyncio.to_thread(self._persist, track_id, list(entry))
+
+    def get_stats(self) -> Dict:
+        return dict(
+            self.stats,
+            files=sum(1 for entry in self._entries.values() if entry[0] is not None),
+            bytes=self.total_bytes,
+            max_bytes=self.max_bytes,
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,152 @@
+import abc
+import asyncio
+import importlib.util
+import json
+import re
+import shlex
+from typing import List, Optional
+
+import discord
+
+# numpy is only imported once a DSP source is built, so the other playback
+# modes never pay for the import.
+DSP_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+SAMPLES_PER_FRAME = discord.opus.Encoder.SAMPLES_PER_FRAME
+CHANNELS = discord.opus.Encoder.CHANNELS
+LOUDNORM_JSON_RE = re.compile(r"\{[^{}]*\"input_i\"[^{}]*\}", re.DOTALL)
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+class AudioProcessor(abc.ABC):
+    # A stage works in place on one 20 ms frame of float32 samples shaped
+    # (samples, channels) and scaled to [-1.0, 1.0].
+    @abc.abstractmethod
+    def process(self, frame: "np.ndarray") -> "np.ndarray":
+        ...
+
+
+class GainStage(AudioProcessor):
+    def __init__(self, volume: float = 1.0, normalization: float = 1.0, ramp_frames: int = 5):
+        _load_numpy()
+        self.volume = volume
+        self.normalization = normalization
+        self.ramp_frames = ramp_frames
+        self._gain = volume * normalization
+        self._ramp = np.linspace(0.0, 1.0, SAMPLES_PER_FRAME, endpoint=False, dtype=np.float32)[:, None]
+
+    def process(self, frame):
+        target = self.volume * self.normalization
+        if self._gain == target:
+            frame *= target
+            return frame
+
+        # Spread a gain change over a few frames instead of jumping, which
+        # would be heard as a click.
+        diff = target - self._gain
+        step = diff if abs(diff) < 1e-3 else diff / self.ramp_frames
+        start = self._gain
+        self._gain += step
+        frame *= start + step * self._ramp
+        return frame
+
+
+class Limiter(AudioProcessor):
+    def __init__(self, threshold: float = 0.89, release_frames: int = 25):
+        _load_numpy()
+        self.threshold = threshold
+        self.release = 1.0 / release_frames
+        self._gain = 1.0
+        self._ramp = np.linspace(0.0, 1.0, SAMPLES_PER_FRAME, endpoint=False, dtype=np.float32)[:, None]
+
+    def process(self, frame):
+        peak = float(np.abs(frame).max()) if frame.size else 0.0
+        required = self.threshold / peak if peak > self.threshold else 1.0
+        # Clamp down immediately, recover slowly.
+        target = required if required < self._gain else min(1.0, self._gain + self.release)
+        if target != 1.0 or self._gain != 1.0:
+            frame *= self._gain + (target - self._gain) * self._ramp
+            np.clip(frame, -self.threshold, self.threshold, out=frame)
+        self._gain = target
+        return frame
+
+
+class DSPAudioSource(discord.AudioSource):
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0, normalization: float = 1.0,
+                 processors: Optional[List[AudioProcessor]] = None):
+        if not DSP_AVAILABLE:
+            raise RuntimeError("numpy is required for the DSP playback mode")
+        _load_numpy()
+        if original.is_opus():
+            raise discord.ClientException("AudioSource must not be Opus encoded.")
+        self.original = original
+        self.gain = GainStage(volume, normalization)
+        self.processors = [self.gain] + (processors if processors is not None else [Limiter()])
+
+    @property
+    def volume(self) -> float:
+        return self.gain.volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self.gain.volume = max(value, 0.0)
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if len(data) != discord.opus.Encoder.FRAME_SIZE:
+            return data
+
+        frame = np.frombuffer(data, dtype=np.int16).astype(np.float32).reshape(-1, CHANNELS)
+        frame *= 1 / 32768
+        for processor in self.processors:
+            frame = processor.process(frame)
+        np.clip(frame, -1.0, 32767 / 32768, out=frame)
+        return (frame * 32768).astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self.original.cleanup()
+
+
+def normalization_gain(loudness: Optional[float], target: float, max_boost_db: float = 10.0) -> float:
+    if loudness is None:
+        return 1.0
+    gain_db = min(target - loudness, max_boost_db)
+    return 10 ** (gain_db / 20)
+
+
+async def measure_loudness(source: str, before_options: str = "") -> Optional[float]:
+    # One full decode through FFmpeg's EBU R128 loudnorm analysis; the result
+    # is cached with the track metadata, so this runs once per track.
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-hide_banner", *shlex.split(before_options), "-i", source,
+        "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    if process.returncode != 0:
+        return None
+
+    match = LOUDNORM_JSON_RE.search(stderr.decode(errors="replace"))
+    if not match:
+        return None
+    try:
+        loudness = float(json.loads(match.group(0))['input_i'])
+    except (KeyError, ValueError):
+        return None
+    # Silence reports -inf, which can't be normalized.
+    return loudness if loudness > -70 else None
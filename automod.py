@@ -0,0 +1,266 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import discord
+from discord.ext import commands
+from discord.ext.commands import has_permissions
+
+from metrics import AUTOMOD_ACTIONS
+from moderation import ModCog
+from rate_limit import TokenBucket
+
+MAX_PHRASES = 500
+MAX_PHRASE_LENGTH = 100
+
+
+class PhraseMatcher:
+    # A guild's whole phrase list is compiled into one alternation, so each
+    # message is scanned once however many phrases are banned. Longer phrases
+    # come first so the longest match at a position wins. Phrases and content
+    # are both casefolded, which also catches "STRASSE" for "straße".
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases = sorted({phrase.casefold() for phrase in phrases}, key=lambda phrase: (-len(phrase), phrase))
+        self._pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(map(re.escape, self.phrases)) + r")(?!\w)"
+        ) if self.phrases else None
+
+    def search(self, content: str) -> Optional[str]:
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(content.casefold())
+        return match.group(0) if match else None
+
+
+class PhraseStore:
+    def __init__(self, path: str = "data/automod.db"):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS automod_phrases (
+                guild_id INTEGER NOT NULL,
+                phrase TEXT NOT NULL,
+                PRIMARY KEY (guild_id, phrase)
+            )
+        """)
+        self._db.commit()
+
+    def _load(self) -> Dict[int, Set[str]]:
+        with self._lock:
+            rows = self._db.execute("SELECT guild_id, phrase FROM automod_phrases").fetchall()
+        phrases: Dict[int, Set[str]] = {}
+        for guild_id, phrase in rows:
+            phrases.setdefault(guild_id, set()).add(phrase)
+        return phrases
+
+    def _execute(self, sql: str, params: Tuple):
+        with self._lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+    async def load(self) -> Dict[int, Set[str]]:
+        return await asyncio.to_thread(self._load)
+
+    async def add(self, guild_id: int, phrase: str):
+        await asyncio.to_thread(self._execute, "INSERT OR IGNORE INTO automod_phrases VALUES (?, ?)", (guild_id, phrase))
+
+    async def remove(self, guild_id: int, phrase: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM automod_phrases WHERE guild_id = ? AND phrase = ?",
+                                (guild_id, phrase))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MemberActivity:
+    __slots__ = ('messages', 'mentions', 'recent_hashes', 'recent_times', 'cooldown_until')
+
+    def __init__(self, messages: TokenBucket, mentions: TokenBucket, history: int):
+        self.messages = messages
+        self.mentions = mentions
+        # Content hashes and times of the member's latest messages, oldest
+        # first; kept apart so counting repeats stays a C-level deque.count.
+        self.recent_hashes: deque = deque(maxlen=history)
+        self.recent_times: deque = deque(maxlen=history)
+        self.cooldown_until = 0.0
+
+
+class AutoModCog(commands.Cog):
+    # Everything on the message path is constant time per message apart from
+    # one regex scan; deletes, warns and mutes run as background tasks so the
+    # listener never waits on Discord.
+
+    def __init__(self, bot, mod: ModCog):
+        self.bot = bot
+        self.mod = mod
+        self.message_rate = int(os.getenv("AUTOMOD_MESSAGE_RATE", "6"))
+        self.message_window = float(os.getenv("AUTOMOD_MESSAGE_WINDOW", "5"))
+        self.mention_limit = int(os.getenv("AUTOMOD_MENTION_LIMIT", "8"))
+        self.mention_window = float(os.getenv("AUTOMOD_MENTION_WINDOW", "30"))
+        self.duplicate_limit = int(os.getenv("AUTOMOD_DUPLICATE_LIMIT", "4"))
+        self.duplicate_window = float(os.getenv("AUTOMOD_DUPLICATE_WINDOW", "60"))
+        self.mute_duration = int(os.getenv("AUTOMOD_MUTE_SECONDS", "600"))
+        self.cooldown = float(os.getenv("AUTOMOD_COOLDOWN", "30"))
+        self.max_tracked = int(os.getenv("AUTOMOD_MAX_TRACKED", "50000"))
+        self.store = PhraseStore(path=os.getenv("AUTOMOD_DB_PATH", "data/automod.db"))
+        self._phrases: Dict[int, Set[str]] = {}
+        self._matchers: Dict[int, PhraseMatcher] = {}
+        self._activity: OrderedDict = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def cog_load(self):
+        self._phrases = await self.store.load()
+        self._matchers = {guild_id: PhraseMatcher(phrases) for guild_id, phrases in self._phrases.items()}
+
+    async def cog_unload(self):
+        for task in self._tasks:
+            task.cancel()
+        self.store.close()
+
+    def _member_activity(self, guild_id: int, member_id: int) -> MemberActivity:
+        key = (guild_id, member_id)
+        activity = self._activity.get(key)
+        if activity is None:
+            activity = self._activity[key] = MemberActivity(
+                TokenBucket(self.message_rate, self.message_window),
+                TokenBucket(self.mention_limit, self.mention_window),
+                # Room for a few messages rotated in a loop, not just one
+                # repeated back to back.
+                self.duplicate_limit * 3
+            )
+            # Least recently active members are dropped first; a dropped
+            # member simply starts again with full buckets.
+            while len(self._activity) > self.max_tracked:
+                self._activity.popitem(last=False)
+        else:
+            self._activity.move_to_end(key)
+        return activity
+
+    def check(self, message: discord.Message) -> Optional[Tuple[str, str]]:
+        # Returns the rule the message broke and the reason recorded for it.
+        now = time.monotonic()
+        activity = self._member_activity(message.guild.id, message.author.id)
+        violation = None
+
+        mentions = len(message.raw_mentions) + len(message.raw_role_mentions) + message.mention_everyone
+        if mentions and not activity.mentions.try_acquire(mentions):
+            violation = ('mentions', "Mass mentions")
+        if not activity.messages.try_acquire() and violation is None:
+            violation = ('spam', "Sending messages too quickly")
+
+        if message.content:
+            digest = hash(message.content.casefold())
+            hashes, times = activity.recent_hashes, activity.recent_times
+            while times and now - times[0] > self.duplicate_window:
+                times.popleft()
+                hashes.popleft()
+            repeats = 1 + hashes.count(digest)
+            hashes.append(digest)
+            times.append(now)
+            if repeats >= self.duplicate_limit and violation is None:
+                violation = ('duplicate', "Repeating the same message")
+
+            matcher = self._matchers.get(message.guild.id)
+            if violation is None and matcher is not None and matcher.search(message.content):
+                violation = ('phrase', "Using a banned phrase")
+        return violation
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild is None or message.author.bot or message.webhook_id is not None:
+            return
+        if message.author.guild_permissions.manage_messages:
+            return
+
+        violation = self.check(message)
+        if violation is None:
+            return
+        rule, reason = violation
+        AUTOMOD_ACTIONS.inc(rule=rule)
+
+        # One warn or mute per burst; later messages in it are only deleted.
+        activity = self._member_activity(message.guild.id, message.author.id)
+        now = time.monotonic()
+        escalate = activity.cooldown_until <= now
+        if escalate:
+            activity.cooldown_until = now + self.cooldown
+        task = asyncio.create_task(self._enforce(message, rule, f"Automod: {reason}", escalate))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _enforce(self, message: discord.Message, rule: str, reason: str, escalate: bool):
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            print(f"Automod could not delete a message: {e}")
+        if not escalate:
+            return
+
+        guild, member = message.guild, message.author
+        try:
+            if rule == 'phrase':
+                await self.mod.warn_member(guild, member, guild.me, reason)
+            else:
+                await self.mod.mute_member(guild, member, guild.me, self.mute_duration, reason)
+        except discord.HTTPException as e:
+            print(f"Automod could not act on {member}: {e}")
+        except Exception as e:
+            # The member may have left, or Discord may reject the timeout;
+            # either way the task ends here instead of failing unobserved.
+            print(f"Automod action on {member} failed: {e!r}")
+
+    @commands.hybrid_group(description="Lists the phrases automod removes.", fallback="list")
+    @commands.guild_only()
+    @has_permissions(manage_guild=True)
+    async def automod(self, ctx: commands.Context):
+        phrases = sorted(self._phrases.get(ctx.guild.id, ()))
+        listing = ", ".join(f"`{phrase}`" for phrase in phrases)
+        if len(listing) > 4000:
+            listing = listing[:4000] + "…"
+        em = discord.Embed(title=f"Banned phrases ({len(phrases)})",
+                           description=listing or "No phrases are banned.",
+                           colour=discord.Colour.blurple())
+        await ctx.send(embed=em, ephemeral=True)
+
+    @automod.command(name="add", description="Bans a word or phrase.")
+    @commands.guild_only()
+    @has_permissions(manage_guild=True)
+    async def add_phrase(self, ctx: commands.Context, *, phrase: str):
+        phrase = phrase.strip().casefold()
+        phrases = self._phrases.setdefault(ctx.guild.id, set())
+        if not phrase or len(phrase) > MAX_PHRASE_LENGTH:
+            return await ctx.send(f":x: Phrases must be between 1 and {MAX_PHRASE_LENGTH} characters.")
+        if len(phrases) >= MAX_PHRASES:
+            return await ctx.send(f":x: A server can ban at most {MAX_PHRASES} phrases.")
+        await self.store.add(ctx.guild.id, phrase)
+        phrases.add(phrase)
+        self._matchers[ctx.guild.id] = PhraseMatcher(phrases)
+        await ctx.send(f"Added a banned phrase ({len(phrases)} total).", ephemeral=True)
+
+    @automod.command(name="remove", description="Unbans a word or phrase.")
+    @commands.guild_only()
+    @has_permissions(manage_guild=True)
+    async def remove_phrase(self, ctx: commands.Context, *, phrase: str):
+        phrase = phrase.strip().casefold()
+        phrases = self._phrases.get(ctx.guild.id, set())
+        if phrase not in phrases:
+            return await ctx.send(":x: That phrase is not banned.")
+        await self.store.remove(ctx.guild.id, phrase)
+        phrases.discard(phrase)
+        self._matchers[ctx.guild.id] = PhraseMatcher(phrases)
+        await ctx.send(f"Removed a banned phrase ({len(phrases)} left).", ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(AutoModCog(bot, bot.get_cog("ModCog")))
@@ -0,0 +1,395 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import sys
+import time
+import types
+from itertools import count
+from typing import Dict, List, Optional
+
+import discord
+
+# Injected latencies in seconds. The extractor and Genius fakes block the
+# calling thread like the real libraries do; the Discord fakes await.
+LATENCY = {
+    'extract': 0.05,
+    'genius': 0.1,
+    'http': 0.03,
+    'voice_connect': 0.05,
+    'ffmpeg_spawn': 0.01,
+}
+
+_ids = count(1)
+
+
+def _video(query: str) -> Dict:
+    video_id = hashlib.sha1(query.encode()).hexdigest()[:11]
+    return {
+        'id': video_id,
+        'title': f"Fake Artist - {query}",
+        'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        'url': f"https://stream.invalid/{video_id}?expire={int(time.time()) + 6 * 3600}",
+        'duration': 180,
+        'thumbnail': f"https://i.ytimg.invalid/{video_id}.jpg",
+        'uploader': "Fake Channel",
+        'acodec': 'opus',
+    }
+
+
+class FakeYoutubeDL:
+    def __init__(self, params: Optional[Dict] = None):
+        self.params = params or {}
+
+    def extract_info(self, query: str, download: bool = False) -> Dict:
+        time.sleep(LATENCY['extract'])
+        if query.startswith('ytsearch'):
+            limit, _, terms = query[len('ytsearch'):].partition(':')
+            return {'entries': [_video(f"{terms} {i}") for i in range(int(limit or 1))]}
+        return _video(query)
+
+    @staticmethod
+    def sanitize_info(info: Dict) -> Dict:
+        return info
+
+
+class FakeSong:
+    def __init__(self, title: str, artist: str):
+        self.title = title
+        self.artist = artist or "Fake Artist"
+        self.lyrics = "la la la\n" * 200
+
+
+class FakeGenius:
+    def __init__(self, access_token: str = "", *args, **kwargs):
+        self.verbose = True
+        self.remove_section_headers = False
+
+    def search_song(self, title: str, artist: str = "") -> FakeSong:
+        time.sleep(LATENCY['genius'])
+        return FakeSong(title, artist)
+
+
+class FakePaginator:
+    def __init__(self, pages: List[discord.Embed], custom_view=None, **kwargs):
+        self.pages = pages
+        self.custom_view = custom_view
+
+    async def send(self, ctx):
+        await ctx.send(embed=self.pages[0])
+
+
+def install():
+    # Must run before music_cog (or anything importing yt_dlp or lyricsgenius)
+    # is imported, so those modules bind to the fakes.
+    yt_dlp = types.ModuleType('yt_dlp')
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    sys.modules['yt_dlp'] = yt_dlp
+
+    lyricsgenius = types.ModuleType('lyricsgenius')
+    lyricsgenius.Genius = FakeGenius
+    sys.modules['lyricsgenius'] = lyricsgenius
+
+    pages = types.ModuleType('discord.ext.pages')
+    pages.Paginator = FakePaginator
+    sys.modules['discord.ext.pages'] = pages
+    import discord.ext
+    discord.ext.pages = pages
+
+
+async def _http():
+    await asyncio.sleep(LATENCY['http'])
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", content: Optional[str] = None, embeds: Optional[List] = None,
+                 author=None, minutes_ago: float = 0, attachments: Optional[List] = None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = embeds or []
+        self.guild = channel.guild
+        self.author = author
+        self.attachments = attachments or []
+        self.webhook_id = None
+        self.raw_mentions: List[int] = []
+        self.raw_role_mentions: List[int] = []
+        self.mention_everyone = False
+        self.created_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=minutes_ago)
+
+    async def edit(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None, **kwargs):
+        await _http()
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self, **kwargs):
+        await _http()
+        self.channel.deleted += 1
+
+
+class FakeChannel:
+    def __init__(self, channel_id: Optional[int] = None, name: str = "general", guild: Optional["FakeGuild"] = None):
+        self.id = channel_id or next(_ids)
+        self.name = name
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+        self.sent = 0
+        self.deleted = 0
+        # Channel history, newest first.
+        self.messages: List[FakeMessage] = []
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None,
+                   embeds: Optional[List[discord.Embed]] = None, **kwargs) -> FakeMessage:
+        await _http()
+        self.sent += 1
+        return FakeMessage(self, content, embeds or ([embed] if embed else []))
+
+    async def purge(self, limit: int = 100, **kwargs) -> List[FakeMessage]:
+        await _http()
+        return [FakeMessage(self) for _ in range(limit)]
+
+    async def history(self, limit: Optional[int] = 100, before=None, after: Optional[datetime.datetime] = None,
+                      oldest_first: Optional[bool] = None):
+        messages = self.messages[:limit]
+        for start in range(0, len(messages), 100):
+            await _http()
+            for message in messages[start:start + 100]:
+                if after is not None and message.created_at <= after:
+                    return
+                yield message
+
+    async def delete_messages(self, messages: List[FakeMessage], **kwargs):
+        await _http()
+        self.deleted += len(messages)
+
+
+class FakeAudioSource(discord.AudioSource):
+    def read(self) -> bytes:
+        return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class FakeVoiceClient:
+    def __init__(self, channel: "FakeVoiceChannel"):
+        self.channel = channel
+        self.guild = channel.guild
+        self.source = None
+        self._playing = self._paused = False
+        self._connected = True
+
+    def play(self, source: discord.AudioSource, *, after=None, **kwargs):
+        self.source = source
+        self._playing, self._paused = True, False
+
+    def stop(self):
+        if self.source is not None:
+            self.source.cleanup()
+        self.source = None
+        self._playing = self._paused = False
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def is_playing(self) -> bool:
+        return self._playing and not self._paused
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def disconnect(self, **kwargs):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class FakeVoiceChannel(FakeChannel):
+    @property
+    def members(self) -> List["FakeMember"]:
+        return [member for member in self.guild.members if member.voice and member.voice.channel is self]
+
+    async def connect(self, **kwargs) -> FakeVoiceClient:
+        await asyncio.sleep(LATENCY['voice_connect'])
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+@functools.total_ordering
+class FakeRole:
+    def __init__(self, name: str, position: int = 0):
+        self.id = next(_ids)
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{self.id}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeRole) and self.id == other.id
+
+    def __lt__(self, other: "FakeRole") -> bool:
+        return (self.position, self.id) < (other.position, other.id)
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+class FakeGuild:
+    def __init__(self, guild_id: Optional[int] = None, name: str = "Benchmark Guild"):
+        self.id = guild_id or next(_ids)
+        self.name = name
+        self.default_role = FakeRole("@everyone")
+        self.roles: List[FakeRole] = [self.default_role]
+        self.voice_client: Optional[FakeVoiceClient] = None
+        self.text_channel = FakeChannel(name="general", guild=self)
+        self.voice_channel = FakeVoiceChannel(name="Music", guild=self)
+        self.members: List["FakeMember"] = []
+        self.chunked = True
+        self.me = FakeMember(self, name="AnyBot", top_role=FakeRole("AnyBot", position=100))
+        self.me.bot = True
+        self.owner_id = self.me.id + 10 ** 9
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return next((channel for channel in (self.text_channel, self.voice_channel) if channel.id == channel_id), None)
+
+    def get_member(self, member_id: int) -> Optional["FakeMember"]:
+        return next((member for member in self.members if member.id == member_id), None)
+
+    async def fetch_member(self, member_id: int) -> "FakeMember":
+        await _http()
+        member = self.get_member(member_id)
+        if member is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+    async def unban(self, user, **kwargs):
+        await _http()
+
+    async def fetch_members(self, limit: Optional[int] = None):
+        for member in self.members[:limit]:
+            yield member
+
+    async def create_role(self, name: str, **kwargs) -> FakeRole:
+        await _http()
+        role = FakeRole(name)
+        self.roles.append(role)
+        return role
+
+
+class FakeMember:
+    def __init__(self, guild: FakeGuild, name: Optional[str] = None, in_voice: bool = True,
+                 top_role: Optional[FakeRole] = None, joined_minutes_ago: float = 60 * 24 * 365):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = self.display_name = name or f"member{self.id}"
+        self.nick = self.global_name = None
+        self.mention = f"<@{self.id}>"
+        self.bot = False
+        self.guild_permissions = discord.Permissions.none()
+        self.top_role = top_role or guild.default_role
+        self.roles: List[FakeRole] = [self.top_role]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.joined_at = now - datetime.timedelta(minutes=joined_minutes_ago)
+        self.created_at = self.joined_at - datetime.timedelta(days=1)
+        guild.members.append(self)
+        self.voice = types.SimpleNamespace(channel=guild.voice_channel) if in_voice else None
+        self.dm_channel = FakeChannel(name=f"dm-{self.id}")
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        return await self.dm_channel.send(*args, **kwargs)
+
+    async def kick(self, **kwargs):
+        await _http()
+
+    async def ban(self, **kwargs):
+        await _http()
+
+    async def edit(self, **kwargs):
+        await _http()
+
+    async def add_roles(self, *roles, **kwargs):
+        await _http()
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, **kwargs):
+        await _http()
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeBot:
+    def __init__(self):
+        self.user = types.SimpleNamespace(id=next(_ids), name="AnyBot")
+        self.channels: Dict[int, FakeChannel] = {}
+        self.guilds: Dict[int, FakeGuild] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+    def add_channel(self, channel: FakeChannel) -> FakeChannel:
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    def add_guild(self, guild: FakeGuild) -> FakeGuild:
+        self.guilds[guild.id] = guild
+        return guild
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    async def wait_until_ready(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self, bot: FakeBot, guild: FakeGuild, author: FakeMember, channel: Optional[FakeChannel] = None):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel or guild.text_channel
+        self.interaction = None
+        self.command = None
+
+    @property
+    def voice_client(self) -> Optional[FakeVoiceClient]:
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        return await self.channel.send(*args, **kwargs)
+
+    async def reply(self, *args, **kwargs) -> FakeMessage:
+        return await self.channel.send(*args, **kwargs)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+def patch_voice(cog):
+    # Replaces the FFmpeg stage of the music cog: the stream is still
+    # resolved through the cache and the (fake) extractor, but no process is
+    # spawned and the voice client never reads frames.
+    from music_cog import PlaybackSource
+
+    async def create_source(track, volume, offset=0.0, guild_id=None):
+        await cog._resolve_stream(track)
+        await asyncio.sleep(LATENCY['ffmpeg_spawn'])
+        return PlaybackSource(FakeAudioSource(), volume, offset, kind="fake", guild_id=guild_id)
+
+    cog._create_source = create_source
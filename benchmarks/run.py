@@ -0,0 +1,568 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Callable, Dict, List
+
+from benchmarks import fakes
+
+fakes.install()
+os.environ.setdefault("GENIUS_ACCESS_TOKEN", "benchmark")
+
+from music_cog import Music, MusicQueue, TrackInfo  # noqa: E402
+from case_store import CaseStore  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from moderation import BulkFilters, CachedMemberConverter, ModCog, PurgeFilters  # noqa: E402
+from automod import AutoModCog, PhraseMatcher  # noqa: E402
+
+MOD_LOG_CHANNEL_ID = 1335611137764626537
+
+
+def summarize(name: str, samples: List[float], unit: str = "s", **extra) -> Dict:
+    ordered = sorted(samples)
+    return dict({
+        'name': name,
+        'unit': unit,
+        'n': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'min': ordered[0],
+        'max': ordered[-1],
+    }, **extra)
+
+
+def time_op(func: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def make_tracks(count: int, requester_id: int = 1) -> List[TrackInfo]:
+    return [
+        TrackInfo({'title': f"Fake Artist - Track {i}", 'webpage_url': f"https://example.invalid/{i}",
+                   'duration': 180 + i % 120, 'id': f"track{i}", 'requester_id': requester_id})
+        for i in range(count)
+    ]
+
+
+def bench_queue(args) -> List[Dict]:
+    results = []
+    for size in args.queue_sizes:
+        tracks = make_tracks(size)
+
+        def filled() -> MusicQueue:
+            queue = MusicQueue(history_size=size)
+            for track in tracks:
+                queue.add(track)
+            return queue
+
+        results.append(summarize(f"queue.add_all[{size}]", time_op(filled, args.repeat)))
+        queue = filled()
+        middle = size // 2
+        ops = {
+            'add_next': lambda: (queue.add_next(tracks[0]), queue.remove(0)),
+            'next': lambda: (queue.next(), queue.add(tracks[0])),
+            'remove_middle': lambda: queue.add_next(queue.remove(middle)),
+            'move_end_to_front': lambda: queue.move(len(queue) - 1, 0),
+            'peek': lambda: queue.peek(2),
+            'get_queue': queue.get_queue,
+            'get_history': queue.get_history,
+            'shuffle': queue.shuffle,
+            'iterate': lambda: sum(1 for _ in queue),
+        }
+        for op, func in ops.items():
+            results.append(summarize(f"queue.{op}[{size}]", time_op(func, args.repeat)))
+    return results
+
+
+async def _music_cog(bot: fakes.FakeBot) -> Music:
+    cog = Music(bot)
+    fakes.patch_voice(cog)
+    await cog.cog_load()
+    return cog
+
+
+async def bench_play(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = await _music_cog(bot)
+    results = []
+    try:
+        for phase in ("cold", "warm"):
+            latencies = []
+
+            async def guild_session(g: int):
+                guild = fakes.FakeGuild(name=f"guild{g}")
+                ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild))
+                for t in range(args.tracks):
+                    started = time.perf_counter()
+                    await cog.play.callback(cog, ctx, query=f"guild {g} song {t}")
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(guild_session(g) for g in range(args.guilds)))
+            elapsed = time.perf_counter() - started
+            results.append(summarize(
+                f"play.{phase}[{args.guilds}x{args.tracks}]", latencies,
+                throughput=len(latencies) / elapsed, wall=elapsed
+            ))
+            for player in cog.players.values():
+                player.reset()
+    finally:
+        cog.cog_unload()
+    return results
+
+
+async def bench_loadplaylist(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = await _music_cog(bot)
+    os.makedirs("playlists", exist_ok=True)
+    contexts = []
+    for g in range(args.guilds):
+        guild = fakes.FakeGuild(name=f"guild{g}")
+        ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild))
+        with open(f"playlists/{ctx.author.id}_bench.txt", "w") as f:
+            json.dump({'name': 'bench', 'tracks': [
+                {'title': f"Track {t}", 'url': f"playlist {g} song {t}"} for t in range(args.playlist_size)
+            ]}, f)
+        contexts.append(ctx)
+
+    results = []
+    try:
+        for phase in ("cold", "warm"):
+            latencies = []
+
+            async def load(ctx):
+                started = time.perf_counter()
+                await cog.load_playlist.callback(cog, ctx, name="bench")
+                latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(load(ctx) for ctx in contexts))
+            elapsed = time.perf_counter() - started
+            results.append(summarize(
+                f"loadplaylist.{phase}[{args.guilds}x{args.playlist_size}]", latencies,
+                throughput=args.guilds * args.playlist_size / elapsed, wall=elapsed
+            ))
+            for player in cog.players.values():
+                player.reset()
+    finally:
+        cog.cog_unload()
+    return results
+
+
+async def bench_embeds(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = await _music_cog(bot)
+    results = []
+    try:
+        for size in args.queue_sizes:
+            guild = fakes.FakeGuild()
+            ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild))
+            player = cog.get_player(guild)
+            player.queue = MusicQueue(history_size=size)
+            for track in make_tracks(size, ctx.author.id):
+                player.queue.add(track)
+            for command in (cog.show_queue, cog.show_history):
+                samples = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    await command.callback(cog, ctx)
+                    samples.append(time.perf_counter() - started)
+                results.append(summarize(f"embeds.{command.name}[{size}]", samples))
+                if command.name == "queue":
+                    while player.queue.next():
+                        pass
+    finally:
+        cog.cog_unload()
+    return results
+
+
+async def bench_moderation(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = ModCog(bot)
+    await cog.cog_load()
+    guild = fakes.FakeGuild()
+    bot.add_channel(fakes.FakeChannel(MOD_LOG_CHANNEL_ID, name="mod-log", guild=guild))
+    moderator = fakes.FakeMember(guild, name="moderator")
+    ctx = fakes.FakeContext(bot, guild, moderator)
+    commands = {
+        'kick': lambda member: cog.kick.callback(cog, ctx, member, "benchmark"),
+        'warn': lambda member: cog.warn.callback(cog, ctx, member, "benchmark"),
+        'mute': lambda member: cog.mute.callback(cog, ctx, member, 60, "benchmark"),
+        'unmute': lambda member: cog.unmute.callback(cog, ctx, member),
+        'report': lambda member: cog.report.callback(cog, ctx, member, "benchmark"),
+    }
+
+    results = []
+    for name, invoke in commands.items():
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            await invoke(fakes.FakeMember(guild))
+            samples.append(time.perf_counter() - started)
+        results.append(summarize(f"moderation.{name}", samples,
+                                 http_round_trips=round(statistics.fmean(samples) / fakes.LATENCY['http'], 1)))
+
+        # The same command issued for many members at once, as a raid
+        # response would.
+        members = [fakes.FakeMember(guild) for _ in range(args.fanout)]
+        started = time.perf_counter()
+        await asyncio.gather(*(invoke(member) for member in members))
+        elapsed = time.perf_counter() - started
+        results.append(summarize(f"moderation.{name}.fanout[{args.fanout}]", [elapsed],
+                                 throughput=args.fanout / elapsed))
+
+    # A member who leaves must drop out of the converter cache even when
+    # discord.py has no cached member to pass to on_member_remove.
+    member = fakes.FakeMember(guild)
+    CachedMemberConverter.remember(member, str(member.id))
+    await cog.on_raw_member_remove(types.SimpleNamespace(guild_id=guild.id, user=member))
+    assert (guild.id, member.id) not in CachedMemberConverter._cache
+    await cog.cog_unload()
+    return results
+
+
+def build_flags(cls, **values):
+    # Built directly rather than parsed, which would need a real Context.
+    flags = cls.__new__(cls)
+    for flag in cls.get_flags().values():
+        setattr(flags, flag.attribute, values.get(flag.attribute, flag.default))
+    return flags
+
+
+async def bench_bulk(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = ModCog(bot)
+    await cog.cog_load()
+    results = []
+    for name in ("mass_kick", "mass_mute", "mass_warn"):
+        guild = fakes.FakeGuild()
+        bot.add_channel(fakes.FakeChannel(MOD_LOG_CHANNEL_ID, name="mod-log", guild=guild))
+        ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild, top_role=fakes.FakeRole("Moderator", position=50)))
+        for _ in range(args.raid_size):
+            fakes.FakeMember(guild)
+        for _ in range(args.raid_size):
+            fakes.FakeMember(guild, joined_minutes_ago=5)
+
+        command = getattr(cog, name)
+        started = time.perf_counter()
+        await command.callback(cog, ctx, [], filters=build_flags(BulkFilters, joined=30, confirm=True))
+        elapsed = time.perf_counter() - started
+        results.append(summarize(f"bulk.{name}[{args.raid_size}]", [elapsed], throughput=args.raid_size / elapsed))
+    await cog.cog_unload()
+    return results
+
+
+async def bench_purge(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    cog = ModCog(bot)
+    cog.purge_rate = args.purge_rate
+    await cog.cog_load()
+    guild = fakes.FakeGuild()
+    raider = fakes.FakeMember(guild, name="raider")
+    regular = fakes.FakeMember(guild)
+    ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild))
+
+    results = []
+    for name, filters in (("all", build_flags(PurgeFilters)), ("user", build_flags(PurgeFilters, user=raider))):
+        channel = ctx.channel = fakes.FakeChannel(guild=guild)
+        # A third of the messages are from the raider, and the oldest 1% are
+        # past the 14 day bulk delete window.
+        old_from = args.purge_size - args.purge_size // 100
+        channel.messages = [
+            fakes.FakeMessage(channel, "spam", author=raider if i % 3 == 0 else regular,
+                              minutes_ago=i / 10 if i < old_from else 15 * 24 * 60 + i)
+            for i in range(args.purge_size)
+        ]
+        started = time.perf_counter()
+        await cog.purge.callback(cog, ctx, args.purge_size, filters=filters)
+        elapsed = time.perf_counter() - started
+        results.append(summarize(f"purge.{name}[{args.purge_size}]", [elapsed], throughput=channel.deleted / elapsed))
+    await cog.cog_unload()
+    return results
+
+
+async def bench_automod(args) -> List[Dict]:
+    bot = fakes.FakeBot()
+    mod = ModCog(bot)
+    automod = AutoModCog(bot, mod)
+    await mod.cog_load()
+    await automod.cog_load()
+    rng = random.Random(0)
+    guilds = [fakes.FakeGuild() for _ in range(args.guilds)]
+    for guild in guilds:
+        bot.add_channel(fakes.FakeChannel(MOD_LOG_CHANNEL_ID, name="mod-log", guild=guild))
+        phrases = {f"banned phrase {i}" for i in range(args.phrases)}
+        automod._phrases[guild.id] = phrases
+        automod._matchers[guild.id] = PhraseMatcher(phrases)
+    members = [fakes.FakeMember(rng.choice(guilds)) for _ in range(args.guilds * 100)]
+    words = [f"word{i}" for i in range(500)]
+
+    messages = []
+    for i in range(args.messages):
+        member = rng.choice(members)
+        content = " ".join(rng.choices(words, k=12))
+        if i % 200 == 0:
+            content += f" banned phrase {rng.randrange(args.phrases)}"
+        messages.append(fakes.FakeMessage(member.guild.text_channel, content, author=member))
+
+    samples = []
+    started = time.perf_counter()
+    for i, message in enumerate(messages):
+        message_started = time.perf_counter()
+        await automod.on_message(message)
+        samples.append(time.perf_counter() - message_started)
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    results = [summarize(f"automod.on_message[{args.phrases} phrases]", samples, throughput=len(messages) / elapsed)]
+    await asyncio.gather(*automod._tasks)
+    await automod.cog_unload()
+    await mod.cog_unload()
+    return results
+
+
+async def bench_scheduler(args) -> List[Dict]:
+    rng = random.Random(0)
+    now = time.time()
+    pending = [(rng.randrange(1, 11), rng.randrange(10 ** 6), rng.choice(("unban", "unwarn", "mute")),
+                now + rng.uniform(3600, 30 * 86400), None, None) for _ in range(args.pending)]
+
+    async def never(action):
+        raise AssertionError("nothing is due")
+
+    scheduler = Scheduler(never, "data/schedule.db")
+    await scheduler.start()
+    started = time.perf_counter()
+    for start in range(0, len(pending), 10_000):
+        await scheduler.schedule_many(pending[start:start + 10_000])
+    elapsed = time.perf_counter() - started
+    results = [summarize(f"scheduler.schedule[{args.pending}]", [elapsed], throughput=args.pending / elapsed)]
+    # Closing right after an earlier action wakes the runner must not hang.
+    await scheduler.schedule(1, 1, "unban", now + 1800)
+    await asyncio.wait_for(scheduler.close(), timeout=5)
+
+    # Restart with the pending actions on disk, then let a burst of expired
+    # warnings run through the moderation cog's handler.
+    bot = fakes.FakeBot()
+    cog = ModCog(bot)
+    cog.scheduler.bucket.fill_rate = cog.scheduler.bucket.capacity = args.scheduler_rate
+    started = time.perf_counter()
+    await cog.cog_load()
+    elapsed = time.perf_counter() - started
+    results.append(summarize(f"scheduler.startup[{args.pending}]", [elapsed]))
+
+    guild = bot.add_guild(fakes.FakeGuild())
+    warned = await cog.get_warned_role(guild)
+    members = [fakes.FakeMember(guild) for _ in range(args.expiring)]
+    for member in members:
+        member.roles.append(warned)
+    started = time.perf_counter()
+    await cog.scheduler.schedule_many((guild.id, member.id, "unwarn", time.time(), None, None) for member in members)
+    while any(warned in member.roles for member in members):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    results.append(summarize(f"scheduler.expire[{args.expiring}]", [elapsed], throughput=args.expiring / elapsed))
+    await cog.cog_unload()
+    return results
+
+
+async def bench_resume(args) -> List[Dict]:
+    # Builds a session in every guild, restarts the cog on the journal it
+    # left behind and times how long until each guild is playing again.
+    bot = fakes.FakeBot()
+    guilds = [bot.add_guild(fakes.FakeGuild(name=f"guild{g}")) for g in range(args.guilds)]
+    cog = await _music_cog(bot)
+    tracks = make_tracks(args.resume_queue)
+    started = time.perf_counter()
+    for guild in guilds:
+        ctx = fakes.FakeContext(bot, guild, fakes.FakeMember(guild))
+        await cog.play.callback(cog, ctx, query=f"{guild.name} song")
+        player = cog.get_player(guild)
+        for track in tracks:
+            player.queue.add(track)
+        for _ in range(args.resume_queue // 10):
+            player.queue.next()
+    await cog.queue_journal.flush()
+    elapsed = time.perf_counter() - started
+    results = [summarize(f"resume.journal[{args.guilds}x{args.resume_queue}]", [elapsed],
+                         bytes=sum(os.path.getsize(entry.path) for entry in os.scandir(cog.queue_journal.directory)))]
+    cog.cog_unload()
+    for guild in guilds:
+        guild.voice_client = None
+
+    started = time.perf_counter()
+    cog = await _music_cog(bot)
+    while sum(1 for player in cog.players.values() if player.current_track) < len(guilds):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    results.append(summarize(f"resume.restore[{args.guilds}x{args.resume_queue}]", [elapsed],
+                             throughput=len(guilds) / elapsed))
+    cog.cog_unload()
+    return results
+
+
+async def bench_cases(args) -> List[Dict]:
+    store = CaseStore("cases.db")
+    await store.start()
+    rng = random.Random(0)
+    guild_ids = list(range(1, 11))
+    member_ids = list(range(1000, 1000 + max(args.cases // 20, 1)))
+    moderator_ids = list(range(1, 51))
+
+    started = time.perf_counter()
+    for i in range(args.cases):
+        store.record(rng.choice(guild_ids), rng.choice(("kick", "warn", "mute", "unmute")),
+                     rng.choice(member_ids), rng.choice(moderator_ids), f"reason {i}")
+        if i % store.batch_size == 0:
+            await asyncio.sleep(0)
+    await store.flush()
+    elapsed = time.perf_counter() - started
+    results = [summarize(f"cases.record_and_flush[{args.cases}]", [elapsed], throughput=args.cases / elapsed)]
+
+    queries = {
+        'member_cases': lambda: store.member_cases(rng.choice(guild_ids), rng.choice(member_ids)),
+        'moderator_stats': lambda: store.moderator_stats(rng.choice(guild_ids), rng.choice(moderator_ids)),
+        'top_moderators': lambda: store.top_moderators(rng.choice(guild_ids), time.time() - 30 * 86400),
+    }
+    for name, query in queries.items():
+        samples = []
+        for _ in range(args.repeat):
+            query_started = time.perf_counter()
+            await query()
+            samples.append(time.perf_counter() - query_started)
+        results.append(summarize(f"cases.{name}[{args.cases}]", samples))
+    await store.close()
+    return results
+
+
+SUITES = {
+    'queue': bench_queue,
+    'play': bench_play,
+    'loadplaylist': bench_loadplaylist,
+    'embeds': bench_embeds,
+    'moderation': bench_moderation,
+    'cases': bench_cases,
+    'bulk': bench_bulk,
+    'purge': bench_purge,
+    'automod': bench_automod,
+    'scheduler': bench_scheduler,
+    'resume': bench_resume,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> int:
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = 0
+    print(f"{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>9}", file=sys.stderr)
+    for result in current['results']:
+        old = previous.get(result['name'])
+        if old is None or not old['median']:
+            continue
+        change = result['median'] / old['median'] - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{result['name']:<45} {old['median']:>12.6f} {result['median']:>12.6f} {change:>+8.1%}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the music and moderation cogs.")
+    parser.add_argument("suites", nargs="*", metavar="suite", help=f"suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--output", "-o", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON file to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--queue-sizes", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--tracks", type=int, default=10, help="play commands per guild")
+    parser.add_argument("--playlist-size", type=int, default=50)
+    parser.add_argument("--cases", type=int, default=200_000, help="moderation cases to seed the case store with")
+    parser.add_argument("--raid-size", type=int, default=500, help="members targeted by each bulk command")
+    parser.add_argument("--purge-size", type=int, default=10_000, help="messages in the purged channel")
+    parser.add_argument("--purge-rate", type=float, default=50,
+                        help="single deletes per second for messages past the bulk delete window")
+    parser.add_argument("--messages", type=int, default=50_000, help="messages fed through automod")
+    parser.add_argument("--phrases", type=int, default=500, help="banned phrases per guild")
+    parser.add_argument("--pending", type=int, default=200_000, help="pending actions in the scheduler")
+    parser.add_argument("--expiring", type=int, default=500, help="actions that come due at once")
+    parser.add_argument("--scheduler-rate", type=float, default=100, help="scheduled actions run per second")
+    parser.add_argument("--resume-queue", type=int, default=1000, help="queued tracks per guild when resuming")
+    parser.add_argument("--fanout", type=int, default=25, help="members per concurrent moderation burst")
+    for key, value in fakes.LATENCY.items():
+        parser.add_argument(f"--{key.replace('_', '-')}-latency", type=float, default=value, dest=f"latency_{key}")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    for key in fakes.LATENCY:
+        fakes.LATENCY[key] = getattr(args, f"latency_{key}")
+    random.seed(0)
+
+    results = []
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # Caches, playlists and cog output stay inside a scratch directory.
+        os.chdir(workdir)
+        try:
+            for name in args.suites or SUITES:
+                suite = SUITES[name]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if asyncio.iscoroutinefunction(suite):
+                        results.extend(asyncio.run(suite(args)))
+                    else:
+                        results.extend(suite(args))
+                print(f"finished {name}", file=sys.stderr)
+        finally:
+            os.chdir(original_cwd)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': dict(fakes.LATENCY),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
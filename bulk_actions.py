@@ -0,0 +1,44 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import discord
+
+from rate_limit import TokenBucket
+
+Action = Callable[[discord.Member], Awaitable]
+Progress = Callable[[int, int], Awaitable]
+
+
+async def run_bulk(members: Sequence[discord.Member], action: Action, concurrency: int = 5,
+                   bucket: Optional[TokenBucket] = None, progress: Optional[Progress] = None,
+                   progress_interval: float = 2.0) -> Tuple[List[discord.Member], List[Tuple[discord.Member, Exception]]]:
+    # Runs the action for every member with at most `concurrency` requests in
+    # flight, paced by the bucket, and reports progress every few seconds.
+    semaphore = asyncio.Semaphore(concurrency)
+    succeeded: List[discord.Member] = []
+    failed: List[Tuple[discord.Member, Exception]] = []
+    last_update = time.monotonic()
+
+    async def run(member: discord.Member):
+        nonlocal last_update
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                await action(member)
+                succeeded.append(member)
+            except discord.HTTPException as e:
+                failed.append((member, e))
+
+        now = time.monotonic()
+        done = len(succeeded) + len(failed)
+        if progress is not None and now - last_update >= progress_interval and done < len(members):
+            last_update = now
+            try:
+                await progress(done, len(members))
+            except discord.HTTPException:
+                pass
+
+    await asyncio.gather(*(run(member) for member in members))
+    return succeeded, failed
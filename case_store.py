@@ -0,0 +1,148 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class Case(NamedTuple):
+    guild_id: int
+    case_id: int
+    action: str
+    member_id: int
+    moderator_id: int
+    reason: Optional[str]
+    duration: Optional[int]
+    created_at: float
+
+
+class CaseStore:
+    def __init__(self, path: str = "data/cases.db", batch_size: int = 200, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Case numbers are per guild and handed out in memory, so recording a
+        # case never waits for the database.
+        self._next_ids: Dict[int, int] = {}
+        self._pending: List[Case] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._writer: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS cases (
+                guild_id INTEGER NOT NULL,
+                case_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                member_id INTEGER NOT NULL,
+                moderator_id INTEGER NOT NULL,
+                reason TEXT,
+                duration INTEGER,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (guild_id, case_id)
+            );
+            CREATE INDEX IF NOT EXISTS cases_member ON cases (guild_id, member_id, created_at);
+            CREATE INDEX IF NOT EXISTS cases_moderator ON cases (guild_id, moderator_id, created_at);
+            CREATE INDEX IF NOT EXISTS cases_created ON cases (guild_id, created_at);
+        """)
+        self._db.commit()
+
+    def _load_next_ids(self) -> Dict[int, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT guild_id, MAX(case_id) FROM cases GROUP BY guild_id").fetchall()
+        return {guild_id: last + 1 for guild_id, last in rows}
+
+    async def start(self):
+        self._next_ids = await asyncio.to_thread(self._load_next_ids)
+        self._writer = asyncio.create_task(self._run())
+
+    def record(self, guild_id: int, action: str, member_id: int, moderator_id: int,
+               reason: Optional[str] = None, duration: Optional[int] = None) -> Case:
+        case_id = self._next_ids.get(guild_id, 1)
+        self._next_ids[guild_id] = case_id + 1
+        case = Case(guild_id, case_id, action, member_id, moderator_id, reason, duration, time.time())
+        self._pending.append(case)
+        self._wake.set()
+        return case
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Give a burst of actions a moment to land in the same transaction.
+            if len(self._pending) < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"Writing moderation cases failed: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    def _write(self, cases: List[Case]):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?, ?, ?)", cases)
+            self._db.commit()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except BaseException:
+                    self._pending[:0] = batch
+                    raise
+
+    def _query(self, sql: str, params: Tuple) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def member_cases(self, guild_id: int, member_id: int, limit: int = 10) -> Tuple[int, List[Case]]:
+        # Returns the member's total case count and their most recent cases.
+        await self.flush()
+        total = (await asyncio.to_thread(
+            self._query, "SELECT COUNT(*) FROM cases WHERE guild_id = ? AND member_id = ?", (guild_id, member_id)
+        ))[0][0]
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT * FROM cases WHERE guild_id = ? AND member_id = ? ORDER BY created_at DESC LIMIT ?",
+            (guild_id, member_id, limit)
+        )
+        return total, [Case(*row) for row in rows]
+
+    async def moderator_stats(self, guild_id: int, moderator_id: int, since: float = 0) -> Dict[str, int]:
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT action, COUNT(*) FROM cases WHERE guild_id = ? AND moderator_id = ? AND created_at >= ? "
+            "GROUP BY action",
+            (guild_id, moderator_id, since)
+        )
+        return dict(rows)
+
+    async def top_moderators(self, guild_id: int, since: float = 0, limit: int = 10) -> List[Tuple[int, int]]:
+        await self.flush()
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT moderator_id, COUNT(*) AS actions FROM cases WHERE guild_id = ? AND created_at >= ? "
+            "GROUP BY moderator_id ORDER BY actions DESC LIMIT ?",
+            (guild_id, since, limit)
+        )
+
+    async def close(self):
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+        try:
+            await self.flush()
+        finally:
+            with self._lock:
+                self._db.close()
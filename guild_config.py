@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import discord
+
+CONFIG_FIELDS = ('log_channel_id', 'senior_role_id', 'junior_role_id', 'warned_role_id')
+
+
+class GuildConfig:
+    __slots__ = ('guild_id',) + CONFIG_FIELDS
+
+    def __init__(self, guild_id: int, log_channel_id: Optional[int] = None, senior_role_id: Optional[int] = None,
+                 junior_role_id: Optional[int] = None, warned_role_id: Optional[int] = None):
+        self.guild_id = guild_id
+        self.log_channel_id = log_channel_id
+        self.senior_role_id = senior_role_id
+        self.junior_role_id = junior_role_id
+        self.warned_role_id = warned_role_id
+
+
+class GuildConfigCache:
+    def __init__(self, path: str = "data/guild_config.db", defaults: Optional[Dict[str, Optional[int]]] = None,
+                 warned_role_name: str = "Warned"):
+        self.path = path
+        self.defaults = defaults or {}
+        self.warned_role_name = warned_role_name
+
+        self._configs: Dict[int, GuildConfig] = {}
+        # (guild id, field) -> resolved Role or channel, dropped by the role and
+        # channel events that could make it stale.
+        self._objects: Dict[Tuple[int, str], Any] = {}
+        self._keys_by_object: Dict[int, set] = {}
+        self._creating: Dict[int, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS guild_config (
+                guild_id INTEGER PRIMARY KEY,
+                log_channel_id INTEGER,
+                senior_role_id INTEGER,
+                junior_role_id INTEGER,
+                warned_role_id INTEGER
+            )
+        """)
+        self._db.commit()
+
+    def _load(self) -> Dict[int, GuildConfig]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT guild_id, {', '.join(CONFIG_FIELDS)} FROM guild_config").fetchall()
+        return {row[0]: GuildConfig(*row) for row in rows}
+
+    def _store(self, config: GuildConfig):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO guild_config VALUES (?, {', '.join('?' for _ in CONFIG_FIELDS)})",
+                (config.guild_id, *(getattr(config, field) for field in CONFIG_FIELDS))
+            )
+            self._db.commit()
+
+    async def load(self):
+        self._configs = await asyncio.to_thread(self._load)
+
+    def get(self, guild_id: int) -> GuildConfig:
+        config = self._configs.get(guild_id)
+        if config is None:
+            config = self._configs[guild_id] = GuildConfig(guild_id, **self.defaults)
+        return config
+
+    async def update(self, guild_id: int, **fields):
+        config = self.get(guild_id)
+        for field, value in fields.items():
+            setattr(config, field, value)
+            self._drop((guild_id, field))
+        await asyncio.to_thread(self._store, config)
+
+    def _resolve(self, guild: discord.Guild, field: str, lookup: Callable[[int], Any]) -> Any:
+        key = (guild.id, field)
+        resolved = self._objects.get(key)
+        if resolved is not None:
+            return resolved
+        object_id = getattr(self.get(guild.id), field)
+        resolved = lookup(object_id) if object_id else None
+        if resolved is not None:
+            self._remember(key, resolved)
+        return resolved
+
+    def _remember(self, key: Tuple[int, str], resolved: Any):
+        self._drop(key)
+        self._objects[key] = resolved
+        self._keys_by_object.setdefault(resolved.id, set()).add(key)
+
+    def _drop(self, key: Tuple[int, str]):
+        resolved = self._objects.pop(key, None)
+        if resolved is not None:
+            keys = self._keys_by_object.get(resolved.id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_object[resolved.id]
+
+    def log_channel(self, guild: discord.Guild, client: discord.Client):
+        # The default log channel may live in another guild, so fall back to
+        # the client-wide lookup.
+        return self._resolve(guild, 'log_channel_id',
+                             lambda channel_id: guild.get_channel(channel_id) or client.get_channel(channel_id))
+
+    def role_mentions(self, guild: discord.Guild) -> Tuple[str, str]:
+        config = self.get(guild.id)
+        return f"<@&{config.senior_role_id}>", f"<@&{config.junior_role_id}>"
+
+    async def warned_role(self, guild: discord.Guild) -> discord.Role:
+        role = self._resolve(guild, 'warned_role_id', guild.get_role)
+        if role is not None:
+            return role
+
+        # Concurrent warns in a guild without the role share one creation.
+        if guild.id in self._creating:
+            return await asyncio.shield(self._creating[guild.id])
+
+        future = asyncio.get_running_loop().create_future()
+        self._creating[guild.id] = future
+        try:
+            role = discord.utils.get(guild.roles, name=self.warned_role_name)
+            if role is None:
+                role = await guild.create_role(name=self.warned_role_name)
+            await self.update(guild.id, warned_role_id=role.id)
+            self._remember((guild.id, 'warned_role_id'), role)
+            future.set_result(role)
+            return role
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._creating[guild.id]
+
+    def _forget(self, object_id: int):
+        # A default log channel is shared by every guild that has no channel
+        # of its own, so one event can invalidate many entries.
+        for key in list(self._keys_by_object.get(object_id, ())):
+            self._drop(key)
+
+    async def role_deleted(self, role: discord.Role):
+        self._forget(role.id)
+        config = self._configs.get(role.guild.id)
+        if config is not None and config.warned_role_id == role.id:
+            # Created again on the next warn.
+            await self.update(role.guild.id, warned_role_id=None)
+
+    def role_updated(self, role: discord.Role):
+        self._forget(role.id)
+
+    def channel_changed(self, channel: discord.abc.GuildChannel):
+        self._forget(channel.id)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
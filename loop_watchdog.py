@@ -0,0 +1,158 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from discord.ext import commands
+
+from metrics import LOOP_STALL_SECONDS
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stall:
+    __slots__ = ('started', 'duration', 'stack', 'location', 'command', 'guild_id')
+
+    def __init__(self, started: float, stack: traceback.StackSummary, location: str,
+                 command: Optional[str], guild_id: Optional[int]):
+        self.started = started
+        self.duration = 0.0
+        self.stack = stack
+        self.location = location
+        self.command = command
+        self.guild_id = guild_id
+
+
+class LoopWatchdog:
+    # A heartbeat task ticks on the event loop; a separate thread notices when
+    # the tick is late and captures what the loop thread is executing right
+    # then, while the blocking call is still on the stack.
+    def __init__(self, threshold: float = 0.25, interval: Optional[float] = None, stack_depth: int = 20,
+                 report_size: int = 10):
+        self.threshold = threshold
+        self.interval = interval or threshold / 5
+        self.stack_depth = stack_depth
+        self.report_size = report_size
+        self.stalls = 0
+        # (location, command) -> [count, total seconds, max seconds, last guild, last stack]
+        self.offenders: Dict[Tuple[str, Optional[str]], List] = {}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._current: Optional[Stall] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            lag = time.monotonic() - beat - self.interval
+            if self._current is not None:
+                if beat > self._current.started:
+                    self._current.duration = beat - self._current.started - self.interval
+                    self._finish(self._current)
+                    self._current = None
+            elif lag > self.threshold:
+                self._current = self._capture(beat)
+
+    def _capture(self, beat: float) -> Optional[Stall]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame, limit=self.stack_depth)
+        command, guild_id = self._find_command(frame)
+        return Stall(beat, stack, self._location(stack), command, guild_id)
+
+    @staticmethod
+    def _location(stack: traceback.StackSummary) -> str:
+        # Attribute the stall to the innermost frame in this project, since
+        # that is the call that should have been awaited or moved to a thread.
+        for entry in reversed(stack):
+            if entry.filename.startswith(PROJECT_ROOT) and "site-packages" not in entry.filename:
+                return f"{os.path.relpath(entry.filename, PROJECT_ROOT)}:{entry.lineno} in {entry.name}"
+        entry = stack[-1]
+        return f"{entry.filename}:{entry.lineno} in {entry.name}"
+
+    @staticmethod
+    def _find_command(frame) -> Tuple[Optional[str], Optional[int]]:
+        # Only frames whose code declares a ctx/interaction variable are
+        # inspected, so unrelated frames' locals are never materialised.
+        while frame is not None:
+            names = frame.f_code.co_varnames
+            if 'ctx' in names or 'interaction' in names:
+                local_vars = frame.f_locals
+                ctx = local_vars.get('ctx')
+                if isinstance(ctx, commands.Context):
+                    return (ctx.command.qualified_name if ctx.command else None,
+                            ctx.guild.id if ctx.guild else None)
+                interaction = local_vars.get('interaction')
+                if interaction is not None and hasattr(interaction, 'guild_id'):
+                    command = getattr(interaction, 'command', None)
+                    return getattr(command, 'qualified_name', None), interaction.guild_id
+            frame = frame.f_back
+        return None, None
+
+    def _finish(self, stall: Stall):
+        self.stalls += 1
+        LOOP_STALL_SECONDS.observe(stall.duration)
+        key = (stall.location, stall.command)
+        with self._lock:
+            offender = self.offenders.get(key)
+            if offender is None:
+                offender = self.offenders[key] = [0, 0.0, 0.0, None, None]
+            offender[0] += 1
+            offender[1] += stall.duration
+            offender[2] = max(offender[2], stall.duration)
+            offender[3] = stall.guild_id
+            offender[4] = stall.stack
+        print(
+            f"Event loop blocked for {stall.duration * 1000:.0f}ms at {stall.location} "
+            f"(command: {stall.command or 'none'}, guild: {stall.guild_id or 'none'})\n"
+            + "".join(stall.stack.format())
+        )
+
+    def report(self) -> List[Dict]:
+        with self._lock:
+            offenders = [(key, list(value)) for key, value in self.offenders.items()]
+        worst = sorted(offenders, key=lambda item: item[1][1], reverse=True)[:self.report_size]
+        return [
+            {
+                'location': location,
+                'command': command,
+                'count': count,
+                'total': total,
+                'max': longest,
+                'guild_id': guild_id,
+                'stack': "".join(stack.format()),
+            }
+            for (location, command), (count, total, longest, guild_id, stack) in worst
+        ]
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+# Decorations that video titles add but lyrics sites never have.
+TITLE_NOISE_RE = re.compile(r"\(.*?\)|\[.*?\]|\b(?:official|lyrics?|audio|video|hd|4k|mv)\b", re.IGNORECASE)
+
+
+class Lyrics(NamedTuple):
+    title: str
+    artist: str
+    lyrics: str
+
+
+class LyricsService:
+    def __init__(self, genius_factory: Callable[[], Any], path: str = "cache/lyrics.db", memory_size: int = 256,
+                 ttl: float = 30 * 86400, negative_ttl: float = 6 * 3600):
+        # The Genius client (and the lyricsgenius import behind it) is only
+        # created by the first lookup that misses the cache.
+        self.genius_factory = genius_factory
+        self._genius = None
+        self._genius_lock = threading.Lock()
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._memory: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS lyrics (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                artist TEXT,
+                lyrics TEXT,
+                fetched_at REAL
+            )
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def normalize_key(title: str, artist: Optional[str] = None) -> str:
+        title = " ".join(TITLE_NOISE_RE.sub(" ", title).lower().split())
+        artist = " ".join((artist or "").lower().split())
+        return f"{title}|{artist}"
+
+    def _expired(self, result: Optional[Lyrics], fetched_at: float) -> bool:
+        ttl = self.ttl if result is not None else self.negative_ttl
+        return fetched_at < time.time() - ttl
+
+    def _remember(self, key: str, result: Optional[Lyrics], fetched_at: float):
+        self._memory[key] = (result, fetched_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, artist, lyrics, fetched_at FROM lyrics WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        # A row without lyrics records a lookup that found nothing.
+        result = Lyrics(row[0], row[1], row[2]) if row[2] is not None else None
+        return result, row[3]
+
+    def _store(self, key: str, result: Optional[Lyrics], fetched_at: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?, ?)",
+                (key, *(result or (None, None, None)), fetched_at)
+            )
+            self._db.commit()
+
+    def _get_genius(self):
+        with self._genius_lock:
+            if self._genius is None:
+                self._genius = self.genius_factory()
+            return self._genius
+
+    def _fetch(self, title: str, artist: Optional[str]) -> Optional[Lyrics]:
+        song = self._get_genius().search_song(title, artist or "")
+        if not song or not song.lyrics:
+            return None
+        return Lyrics(song.title, song.artist, song.lyrics)
+
+    async def search(self, title: str, artist: Optional[str] = None) -> Optional[Lyrics]:
+        key = self.normalize_key(title, artist)
+
+        cached = self._memory.get(key)
+        if cached is not None and not self._expired(*cached):
+            self._memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return cached[0]
+
+        # Concurrent requests for the same song share a single lookup.
+        if key in self._inflight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._lookup(key, title, artist)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't leave an unretrieved exception.
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _lookup(self, key: str, title: str, artist: Optional[str]) -> Optional[Lyrics]:
+        stored = await asyncio.to_thread(self._load, key)
+        if stored is not None and not self._expired(*stored):
+            self.stats['disk_hits'] += 1
+            self._remember(key, *stored)
+            return stored[0]
+
+        self.stats['misses'] += 1
+        result = await asyncio.to_thread(self._fetch, title, artist)
+        fetched_at = time.time()
+        self._remember(key, result, fetched_at)
+        await asyncio.to_thread(self._store, key, result, fetched_at)
+        return result
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, memory_entries=len(self._memory))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,26 +1,107 @@
 import os
 import asyncio
+import hashlib
+import json
 
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
+from automod import AutoModCog
+from loop_watchdog import LoopWatchdog
+from metrics import REGISTRY, MetricsServer
 from moderation import ModCog
-from music_cog import Music
 
 load_dotenv()
 
 class AnyBot(commands.Bot):
+    metrics_server = None
+    watchdog = None
+
     async def setup_hook(self):
+        if os.getenv("LOOP_WATCHDOG") == "1":
+            self.watchdog = LoopWatchdog(threshold=float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "250")) / 1000)
+            self.watchdog.start()
         await self.load_cogs()
-        await self.tree.sync()
+        await self.sync_commands()
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            self.metrics_server = MetricsServer(REGISTRY, os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            await self.metrics_server.start()
+
+    async def close(self):
+        if self.watchdog:
+            self.watchdog.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await super().close()
 
     async def load_cogs(self):
-        await self.add_cog(ModCog(self))
-        await self.add_cog(Music(self))
+        mod = ModCog(self)
+        cogs = [mod]
+        if os.getenv("AUTOMOD_ENABLED", "1") != "0":
+            cogs.append(AutoModCog(self, mod))
+        if os.getenv("MUSIC_ENABLED", "1") != "0":
+            # Imported here so a moderation-only deployment never loads the
+            # music stack.
+            from music_cog import Music
+            cogs.append(Music(self))
+        await asyncio.gather(*(self.add_cog(cog) for cog in cogs))
+
+    def command_tree_fingerprint(self) -> str:
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        payload.sort(key=lambda command: (command.get('type', 1), command['name']))
+        data = json.dumps([self.application_id, payload], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def sync_commands(self):
+        # Syncing is slow and heavily rate limited, so it only happens when the
+        # command definitions changed since the last successful sync.
+        state_path = os.getenv("COMMAND_SYNC_STATE", "cache/command_tree.sha256")
+        fingerprint = self.command_tree_fingerprint()
+        try:
+            previous = await asyncio.to_thread(self._read_sync_state, state_path)
+        except OSError:
+            previous = None
+        if previous == fingerprint and os.getenv("FORCE_COMMAND_SYNC") != "1":
+            print("Application commands unchanged, skipping sync")
+            return
+
+        await self.tree.sync()
+        await asyncio.to_thread(self._write_sync_state, state_path, fingerprint)
+        print("Application commands synced")
+
+    @staticmethod
+    def _read_sync_state(path: str) -> str:
+        with open(path) as f:
+            return f.read().strip()
 
-intents = discord.Intents.all()
-client = AnyBot(command_prefix="!", intents=intents)
+    @staticmethod
+    def _write_sync_state(path: str, fingerprint: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(fingerprint)
+
+def client_options() -> dict:
+    # "lean" asks only for what the cogs use and never chunks: members are
+    # fetched on demand by the moderation converters, and only members in
+    # voice channels are cached (the music cog reads their voice state).
+    # "full" keeps the old behaviour of caching every member at startup.
+    if os.getenv("INTENTS_PROFILE", "lean") == "full":
+        return {'intents': discord.Intents.all()}
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+    return {
+        'intents': intents,
+        'member_cache_flags': member_cache_flags,
+        'chunk_guilds_at_startup': False,
+    }
+
+client = AnyBot(command_prefix="!", **client_options())
 client.remove_command("help")
 
 @client.event
@@ -45,6 +126,55 @@ async def on_command_error(ctx, error):
 async def test(ctx):
     await ctx.send("Tested")
 
+@client.hybrid_command(name="metrics")
+@commands.is_owner()
+async def show_metrics(ctx):
+    embed = discord.Embed(title="Metrics", color=0x3498db)
+    for name, label in (
+        ("anybot_time_to_first_audio_seconds", "Time to First Audio"),
+        ("anybot_extraction_seconds", "Extraction"),
+        ("anybot_ffmpeg_lifetime_seconds", "FFmpeg Lifetime"),
+    ):
+        count, mean, p95 = REGISTRY.get(name).summary(0.95)
+        embed.add_field(name=label, value=f"{count} samples, mean {mean:.2f}s, p95 ≤ {p95:g}s" if count else "No samples")
+
+    exits = REGISTRY.get("anybot_ffmpeg_exits_total")
+    codes = ", ".join(f"{labels['code']}: {value:.0f}" for labels, value in exits.samples())
+    embed.add_field(name="FFmpeg Exit Codes", value=codes or "None", inline=False)
+    embed.add_field(name="Frame Underruns", value=f"{REGISTRY.get('anybot_frame_underruns_total').total():.0f}")
+
+    for name, _, _, samples in REGISTRY.collect():
+        if name == "anybot_cache_hit_ratio":
+            embed.add_field(name="Cache Hit Ratio",
+                            value="\n".join(f"{labels['cache']}: {value:.1%}" for labels, value in samples) or "None")
+        elif name == "anybot_players":
+            embed.add_field(name="Players", value=str(int(samples[0][1])))
+        elif name == "anybot_queue_depth":
+            embed.add_field(name="Queued Tracks", value=str(int(sum(value for _, value in samples))))
+    await ctx.send(embed=embed)
+
+@client.hybrid_command(name="stalls")
+@commands.is_owner()
+async def show_stalls(ctx):
+    if not client.watchdog:
+        return await ctx.send("The event loop watchdog is not enabled (set LOOP_WATCHDOG=1).")
+
+    report = client.watchdog.report()
+    embed = discord.Embed(
+        title="Event Loop Stalls",
+        description=f"{client.watchdog.stalls} stalls over {client.watchdog.threshold * 1000:.0f}ms"
+                    if report else "No stalls recorded.",
+        color=0xe67e22 if report else 0x2ecc71
+    )
+    for offender in report[:5]:
+        embed.add_field(
+            name=f"{offender['location']}"[:256],
+            value=f"Command: {offender['command'] or 'none'} | Guild: {offender['guild_id'] or 'none'}\n"
+                  f"{offender['count']}x, {offender['total']:.2f}s total, {offender['max'] * 1000:.0f}ms max",
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
 async def main():
     async with client:
         token = os.getenv("DISCORD_BOT_TOKEN")  
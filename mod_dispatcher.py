@@ -0,0 +1,108 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from rate_limit import TokenBucket
+
+Notify = Callable[[str], Awaitable]
+
+
+class ModDispatcher:
+    # Side effects of moderation commands (mod-log posts and DMs) run here in
+    # the background, so a command can answer as soon as its action is done.
+    # Log posts queue up per channel while that channel's bucket is empty and
+    # go out together, up to Discord's limit of 10 embeds per message.
+    MAX_EMBEDS = 10
+
+    def __init__(self, channel_rate: int = 5, channel_per: float = 5.0, dm_rate: int = 5, dm_per: float = 5.0,
+                 global_rate: int = 40, global_per: float = 1.0):
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.dm_rate = dm_rate
+        self.dm_per = dm_per
+        # Kept below Discord's global limit of 50 requests per second, which
+        # the rest of the bot shares.
+        self._global = TokenBucket(global_rate, global_per)
+        self._buckets: Dict[Tuple, TokenBucket] = {}
+        self._logs: Dict[int, List[Tuple[Optional[str], discord.Embed]]] = {}
+        self._log_tasks: Dict[int, asyncio.Task] = {}
+        self._tasks = set()
+        self.stats = {'log_posts': 0, 'log_embeds': 0, 'dms': 0, 'failures': 0}
+
+    async def _acquire(self, route: Tuple):
+        await self._bucket(route).acquire()
+        await self._global.acquire()
+
+    def _bucket(self, route: Tuple) -> TokenBucket:
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            if route[0] == 'dm':
+                bucket = TokenBucket(self.dm_rate, self.dm_per)
+            else:
+                bucket = TokenBucket(self.channel_rate, self.channel_per)
+            self._buckets[route] = bucket
+        return bucket
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def log(self, channel: Optional[discord.abc.Messageable], embed: discord.Embed, content: Optional[str] = None):
+        if channel is None:
+            return
+        self._logs.setdefault(channel.id, []).append((content, embed))
+        if channel.id not in self._log_tasks:
+            self._log_tasks[channel.id] = self._spawn(self._drain_logs(channel))
+
+    async def _drain_logs(self, channel: discord.abc.Messageable):
+        pending = self._logs[channel.id]
+        try:
+            while pending:
+                await self._acquire(('channel', channel.id))
+                batch = pending[:self.MAX_EMBEDS]
+                del pending[:len(batch)]
+                # Entries normally share the same role mentions; send each
+                # distinct content once.
+                content = " ".join(dict.fromkeys(content for content, _ in batch if content)) or None
+                try:
+                    await channel.send(content, embeds=[embed for _, embed in batch])
+                    self.stats['log_posts'] += 1
+                    self.stats['log_embeds'] += len(batch)
+                except discord.HTTPException as e:
+                    self.stats['failures'] += 1
+                    print(f"Could not post to the mod log: {e}")
+        finally:
+            del self._log_tasks[channel.id]
+            if not pending:
+                del self._logs[channel.id]
+
+    def dm(self, member: discord.abc.User, embed: discord.Embed, notify: Optional[Notify] = None):
+        self._spawn(self._send_dm(member, embed, notify))
+
+    async def _send_dm(self, member: discord.abc.User, embed: discord.Embed, notify: Optional[Notify]):
+        await self._acquire(('dm', member.id))
+        try:
+            await member.send(embed=embed)
+            self.stats['dms'] += 1
+            return
+        except discord.Forbidden:
+            message = "The member's DMs are off so I couldn't DM them."
+        except Exception as e:
+            message = "An error occurred while sending the DM."
+            print(e)
+        self.stats['failures'] += 1
+        if notify is not None:
+            try:
+                await notify(message)
+            except discord.HTTPException as e:
+                print(f"Could not report a failed DM: {e}")
+
+    async def close(self, timeout: float = 10.0):
+        # Give queued posts and DMs a chance to go out before shutting down.
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
@@ -1,25 +1,207 @@
+import asyncio
 import datetime
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Annotated, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import has_permissions, HybridCommand
 
+from bulk_actions import run_bulk
+from case_store import Case, CaseStore
+from guild_config import GuildConfigCache
+from mod_dispatcher import ModDispatcher
+from purge_engine import run_purge
+from rate_limit import TokenBucket
+from scheduler import ScheduledAction, Scheduler
+
+# Discord caps timeouts at 28 days; longer mutes are renewed shortly before
+# each timeout runs out.
+MAX_TIMEOUT = 28 * 86400
+TIMEOUT_RENEW_MARGIN = 3600
+
+class CachedMemberConverter(commands.MemberConverter, app_commands.Transformer):
+    # Without a chunked member cache every prefix lookup is a gateway or HTTP
+    # request, so resolved members are kept for a short while. Slash commands
+    # get the member resolved by Discord and only seed the cache. Leaving the
+    # guild evicts an entry through the raw remove event, but discord.py only
+    # reports updates for members it caches, so under the lean intents
+    # profile roles and nicknames can be up to `ttl` seconds stale.
+    ttl = 60.0
+    max_size = 1024
+    _cache: OrderedDict = OrderedDict()
+    _mention_re = re.compile(r'<@!?([0-9]{15,20})>$|([0-9]{15,20})$')
+
+    @property
+    def type(self) -> discord.AppCommandOptionType:
+        return discord.AppCommandOptionType.user
+
+    @classmethod
+    def _key(cls, guild_id: int, argument: str):
+        match = cls._mention_re.match(argument)
+        if match:
+            return guild_id, int(match.group(1) or match.group(2))
+        return guild_id, argument
+
+    @classmethod
+    def remember(cls, member: discord.Member, argument=None):
+        key = cls._key(member.guild.id, argument) if argument is not None else (member.guild.id, member.id)
+        cls._cache[key] = (member, time.monotonic() + cls.ttl)
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > cls.max_size:
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def invalidate(cls, guild_id: int, member_id: int):
+        for key, (member, _) in list(cls._cache.items()):
+            if key[0] == guild_id and member.id == member_id:
+                del cls._cache[key]
+
+    async def convert(self, ctx: commands.Context, argument: str) -> discord.Member:
+        if ctx.guild is None:
+            return await super().convert(ctx, argument)
+
+        key = self._key(ctx.guild.id, argument)
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[0]
+
+        member = await super().convert(ctx, argument)
+        self.remember(member, argument)
+        return member
+
+    async def transform(self, interaction: discord.Interaction, value: discord.Member) -> discord.Member:
+        if isinstance(value, discord.Member):
+            self.remember(value)
+        return value
+
+
+class BulkFilters(commands.FlagConverter):
+    joined: Optional[int] = commands.flag(default=None, description="Members who joined in the last N minutes")
+    created: Optional[int] = commands.flag(default=None, description="Accounts created in the last N days")
+    name: Optional[str] = commands.flag(default=None, description="Regex matched against names and nicknames")
+    reason: str = commands.flag(default="Raid response", description="Reason recorded for every member")
+    duration: int = commands.flag(default=3600, description="Timeout length in seconds (massmute only)")
+    confirm: bool = commands.flag(default=False, description="Required to act on filter matches")
+
+    @property
+    def has_criteria(self) -> bool:
+        return self.joined is not None or self.created is not None or self.name is not None
+
+
+class PurgeFilters(commands.FlagConverter):
+    user: Optional[discord.User] = commands.flag(default=None, description="Only messages from this user")
+    contains: Optional[str] = commands.flag(default=None, description="Regex matched against message content")
+    attachments: bool = commands.flag(default=False, description="Only messages with attachments")
+    bots: bool = commands.flag(default=False, description="Only messages from bots")
+    within: Optional[int] = commands.flag(default=None, description="Only messages from the last N minutes")
+
+
+class PurgeControls(discord.ui.View):
+    def __init__(self, author_id: int, cancel: asyncio.Event):
+        super().__init__(timeout=None)
+        self.author_id = author_id
+        self.cancel = cancel
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id or interaction.user.guild_permissions.administrator
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.danger)
+    async def stop_purge(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cancel.set()
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+
+
 class ModCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.senior_moderator_role_id = 1345486289021178007
-        self.junior_moderator_role_id = 1345486289021178007
-    
-    def get_role_mentions(self):
-        senior_moderator_role = f"<@&{self.senior_moderator_role_id}>"
-        junior_moderator_role = f"<@&{self.junior_moderator_role_id}>"
-        return senior_moderator_role, junior_moderator_role
+        self.guild_config = GuildConfigCache(
+            path=os.getenv("GUILD_CONFIG_PATH", "data/guild_config.db"),
+            defaults={
+                'log_channel_id': int(os.getenv("MOD_LOG_CHANNEL_ID", "1335611137764626537")),
+                'senior_role_id': int(os.getenv("SENIOR_MODERATOR_ROLE_ID", "1345486289021178007")),
+                'junior_role_id': int(os.getenv("JUNIOR_MODERATOR_ROLE_ID", "1345486289021178007")),
+            }
+        )
+        CachedMemberConverter.ttl = float(os.getenv("MEMBER_CACHE_TTL", "60"))
+        self.case_store = CaseStore(path=os.getenv("CASE_DB_PATH", "data/cases.db"))
+        self.dispatcher = ModDispatcher()
+        self.bulk_concurrency = int(os.getenv("BULK_ACTION_CONCURRENCY", "10"))
+        self.bulk_rate = float(os.getenv("BULK_ACTION_RATE", "25"))
+        self.bulk_limit = int(os.getenv("BULK_ACTION_LIMIT", "1000"))
+        self._bulk_buckets: Dict[int, TokenBucket] = {}
+        self.purge_concurrency = int(os.getenv("PURGE_CONCURRENCY", "5"))
+        self.purge_rate = float(os.getenv("PURGE_RATE", "5"))
+        self.purge_limit = int(os.getenv("PURGE_LIMIT", "10000"))
+        self._purge_buckets: Dict[int, TokenBucket] = {}
+        self._purges: Dict[int, asyncio.Event] = {}
+        self.warn_expiry = int(os.getenv("WARN_EXPIRY_SECONDS", str(30 * 86400)))
+        self.scheduler = Scheduler(
+            self._run_scheduled,
+            path=os.getenv("SCHEDULE_DB_PATH", "data/schedule.db"),
+            rate=float(os.getenv("SCHEDULED_ACTION_RATE", "10"))
+        )
+
+    async def cog_load(self):
+        await self.guild_config.load()
+        await self.case_store.start()
+        await self.scheduler.start()
+
+    async def cog_unload(self):
+        await self.scheduler.close()
+        await self.dispatcher.close()
+        await self.case_store.close()
+        self.guild_config.close()
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # on_member_remove only fires for cached members.
+        CachedMemberConverter.invalidate(payload.guild_id, payload.user.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        CachedMemberConverter.invalidate(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, user: discord.User):
+        await self.scheduler.cancel(guild.id, user.id, "unban")
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        await self.guild_config.role_deleted(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.guild_config.role_updated(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.guild_config.channel_changed(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        self.guild_config.channel_changed(after)
+
+    def get_role_mentions(self, guild: discord.Guild):
+        return self.guild_config.role_mentions(guild)
+
+    async def get_warned_role(self, guild: discord.Guild) -> discord.Role:
+        return await self.guild_config.warned_role(guild)
+
+    def post_mod_log(self, guild: discord.Guild, embed: discord.Embed):
+        senior_moderator_role, junior_moderator_role = self.get_role_mentions(guild)
+        self.dispatcher.log(self.guild_config.log_channel(guild, self.bot), embed,
+                            f"{senior_moderator_role} {junior_moderator_role}")
 
     @commands.hybrid_command(description="Kicks a member from the server.")
     @has_permissions(kick_members=True)
-    async def kick(self, ctx: commands.Context, member: discord.Member, reason: str = "No reason provided"):
-        senior_moderator_role, junior_moderator_role = self.get_role_mentions()
-
+    async def kick(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], reason: str = "No reason provided"):
         em = discord.Embed(title=f'{member.name} was kicked',
                            description="Reason: " + reason,
                            colour=discord.Colour.red())
@@ -29,139 +211,468 @@ class ModCog(commands.Cog):
             colour=discord.Colour.red())
         try:
             await member.kick(reason=reason)
-            log_embed = discord.Embed(title=f"New Case | Kick | {member}",
+            case = self.case_store.record(ctx.guild.id, "kick", member.id, ctx.author.id, reason)
+            log_embed = discord.Embed(title=f"New Case #{case.case_id} | Kick | {member}",
                                       colour=discord.Colour.red())
 
             log_embed.add_field(name='Member', value=f'{member.mention}')
             log_embed.add_field(name="Moderator", value=f'{ctx.author}')
             log_embed.add_field(name="Reason", value=f'{reason}')
-            mod_channel = self.bot.get_channel(1335611137764626537)
-            if mod_channel:
-                await mod_channel.send(f"{senior_moderator_role} {junior_moderator_role}", embed=log_embed)
-            await ctx.send(embed=em)
         except discord.Forbidden:
-            await ctx.send(":x: You can't kick an administrator or I lack the necessary permissions.")
+            return await ctx.send(":x: You can't kick an administrator or I lack the necessary permissions.")
         except Exception as e:
-            await ctx.send(":x: An error occurred while trying to kick the member.")
             print(e)
+            return await ctx.send(":x: An error occurred while trying to kick the member.")
 
-        try:
-            await member.send(embed=embed)
-        except discord.Forbidden:
-            await ctx.send("The member's DMs are off so I couldn't DM them.")
-        except Exception as e:
-            await ctx.send("An error occurred while sending the DM.")
-            print(e)
+        await ctx.send(embed=em)
+        self.post_mod_log(ctx.guild, log_embed)
+        self.dispatcher.dm(member, embed, notify=ctx.send)
 
-    @commands.hybrid_command(description="Warns a member and gives them the 'Warned' role.")
+    @commands.hybrid_command(description="Bans a member for a specified duration (in seconds).")
     @has_permissions(ban_members=True)
-    async def warn(self, ctx: commands.Context, member: discord.Member, reason: str = "No reason provided"):
-        senior_moderator_role, junior_moderator_role = self.get_role_mentions()
-
-        mod_channel = self.bot.get_channel(1335611137764626537)
-        em = discord.Embed(title=f'{member.name} was warned',
+    async def tempban(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], duration: int, reason: str = "No reason provided"):
+        if duration <= 0:
+            return await ctx.send(":x: The duration must be positive.")
+        em = discord.Embed(title=f'{member.name} was banned for {duration} seconds',
                            description="Reason: " + reason,
-                           colour=discord.Colour.orange())
-
+                           colour=discord.Colour.dark_red())
+        embed = discord.Embed(
+            title=f'You were banned from {ctx.guild.name} for {duration} seconds',
+            description="Reason: " + reason,
+            colour=discord.Colour.dark_red())
         try:
-            warned = discord.utils.get(ctx.guild.roles, name="Warned")
-            guild = ctx.guild
-            if not warned:
-                warned = await guild.create_role(name="Warned")
-
-            await member.add_roles(warned)
-            log_embed = discord.Embed(title=f"New Case | Warn | {member}",
-                                      colour=discord.Colour.orange())
+            await member.ban(reason=reason)
+            await self.scheduler.schedule(ctx.guild.id, member.id, "unban", time.time() + duration,
+                                          reason=reason, replace=True)
+            case = self.case_store.record(ctx.guild.id, "tempban", member.id, ctx.author.id, reason, duration)
+            log_embed = discord.Embed(title=f"New Case #{case.case_id} | Temp Ban | {member}",
+                                      colour=discord.Colour.dark_red())
 
             log_embed.add_field(name='Member', value=f'{member.mention}')
             log_embed.add_field(name="Moderator", value=f'{ctx.author}')
             log_embed.add_field(name="Reason", value=f'{reason}')
-
-            if mod_channel:
-                await mod_channel.send(f"{senior_moderator_role} {junior_moderator_role}", embed=log_embed)
-            await ctx.send(embed=em)
+            log_embed.add_field(name="Expires", value=f"<t:{int(time.time() + duration)}:R>")
         except discord.Forbidden:
-            await ctx.send("I don't have permission to add roles.")
+            return await ctx.send(":x: You can't ban an administrator or I lack the necessary permissions.")
         except Exception as e:
-            await ctx.send("There was an error.")
             print(e)
-            return
+            return await ctx.send(":x: An error occurred while trying to ban the member.")
+
+        await ctx.send(embed=em)
+        self.post_mod_log(ctx.guild, log_embed)
+        self.dispatcher.dm(member, embed, notify=ctx.send)
+
+    @commands.hybrid_command(description="Warns a member and gives them the 'Warned' role.")
+    @has_permissions(ban_members=True)
+    async def warn(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], reason: str = "No reason provided"):
+        em = discord.Embed(title=f'{member.name} was warned',
+                           description="Reason: " + reason,
+                           colour=discord.Colour.orange())
 
         try:
-            dm_embed = discord.Embed(title="You were warned",
-                                     description="Reason: " + reason,
-                                     colour=discord.Colour.orange())
-            await member.send(embed=dm_embed)
+            await self.warn_member(ctx.guild, member, ctx.author, reason, notify=ctx.send)
         except discord.Forbidden:
-            await ctx.send("The member's DMs are off so I couldn't DM them.")
+            return await ctx.send("I don't have permission to add roles.")
         except Exception as e:
-            await ctx.send("An error occurred while sending the DM.")
             print(e)
+            return await ctx.send("There was an error.")
 
-    @commands.hybrid_command(description="Reports a member to the moderators.")
-    async def report(self, ctx: commands.Context, member: discord.Member, reason: str = "No reason provided"):
-        senior_moderator_role, junior_moderator_role = self.get_role_mentions()
+        await ctx.send(embed=em)
+
+    async def warn_member(self, guild: discord.Guild, member: discord.Member, moderator: discord.abc.User,
+                          reason: str, notify: Optional[Callable[[str], Awaitable]] = None) -> Case:
+        # Shared by the warn command and automod.
+        warned = await self.get_warned_role(guild)
+        await member.add_roles(warned)
+        case = self.case_store.record(guild.id, "warn", member.id, moderator.id, reason)
+        log_embed = discord.Embed(title=f"New Case #{case.case_id} | Warn | {member}",
+                                  colour=discord.Colour.orange())
+
+        log_embed.add_field(name='Member', value=f'{member.mention}')
+        log_embed.add_field(name="Moderator", value=f'{moderator}')
+        log_embed.add_field(name="Reason", value=f'{reason}')
+        self.post_mod_log(guild, log_embed)
+        dm_embed = discord.Embed(title="You were warned",
+                                 description="Reason: " + reason,
+                                 colour=discord.Colour.orange())
+        self.dispatcher.dm(member, dm_embed, notify=notify)
+        if self.warn_expiry > 0:
+            # A new warning restarts the clock on the Warned role.
+            await self.scheduler.schedule(guild.id, member.id, "unwarn", time.time() + self.warn_expiry, replace=True)
+        return case
 
+    @commands.hybrid_command(description="Reports a member to the moderators.")
+    async def report(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], reason: str = "No reason provided"):
         em = discord.Embed(
             title=":police_car: A new report has arrived",
             description=f"{ctx.author.mention} reported {member.mention} for " + reason,
             colour=discord.Colour.orange())
-        channel = self.bot.get_channel(1335611137764626537)
         await ctx.send(f"{ctx.author.mention} Thanks for reporting, a staff member will look into it soon.")
-        if channel:
-            await channel.send(f"{senior_moderator_role} {junior_moderator_role}", embed=em)
+        self.post_mod_log(ctx.guild, em)
+
+    @staticmethod
+    def _purge_check(filters: PurgeFilters) -> Callable[[discord.Message], bool]:
+        pattern = re.compile(filters.contains, re.IGNORECASE) if filters.contains else None
+
+        def check(message: discord.Message) -> bool:
+            if filters.user is not None and message.author.id != filters.user.id:
+                return False
+            if filters.bots and not message.author.bot:
+                return False
+            if filters.attachments and not message.attachments:
+                return False
+            return pattern is None or bool(pattern.search(message.content))
+        return check
 
-    @commands.hybrid_command(description="Clears a specified number of messages.")
+    async def _end_purge(self, ctx: commands.Context, status: Optional[discord.Message], content: str):
+        # The status message loses its Cancel button however the purge ends.
+        if status is not None:
+            try:
+                return await status.edit(content=content, view=None)
+            except discord.HTTPException:
+                pass
+        await ctx.send(content)
+
+    @commands.hybrid_command(description="Clears messages, optionally only those matching filters.")
     @has_permissions(administrator=True)
-    async def purge(self, ctx: commands.Context, amount: int = 1):
+    async def purge(self, ctx: commands.Context, amount: int = 1, *, filters: PurgeFilters):
+        # `amount` is how many messages are searched, as with TextChannel.purge;
+        # filters narrow down which of those are deleted.
+        if not 0 < amount <= self.purge_limit:
+            return await ctx.send(f":x: Purges can search between 1 and {self.purge_limit} messages.")
+        if ctx.channel.id in self._purges:
+            return await ctx.send(":x: A purge is already running in this channel.")
+        try:
+            check = self._purge_check(filters)
+        except re.error as e:
+            return await ctx.send(f":x: Invalid content pattern: {e}")
+        after = discord.utils.utcnow() - datetime.timedelta(minutes=filters.within) if filters.within else None
+
+        cancel = self._purges[ctx.channel.id] = asyncio.Event()
+        controls = PurgeControls(ctx.author.id, cancel)
+        status = None
         try:
-            await ctx.channel.purge(limit=amount)
-            await ctx.send(f"Cleared {amount} messages.", delete_after=5)
+            status = await ctx.send(f"Purging up to {amount} messages...", view=controls)
+            bucket = self._purge_buckets.get(ctx.channel.id)
+            if bucket is None:
+                bucket = self._purge_buckets[ctx.channel.id] = TokenBucket(self.purge_rate, 1.0)
+            result = await run_purge(
+                ctx.channel, amount, check, before=status, after=after, concurrency=self.purge_concurrency,
+                bucket=bucket, cancel=cancel,
+                progress=lambda scanned, deleted: status.edit(
+                    content=f"Purging up to {amount} messages... ({deleted} deleted, {scanned} searched)")
+            )
         except discord.Forbidden:
-            await ctx.send("I don't have permission to delete messages.")
+            return await self._end_purge(ctx, status, "I don't have permission to delete messages.")
         except Exception as e:
-            await ctx.send(f"Error: {e}")
+            return await self._end_purge(ctx, status, f"Error: {e}")
+        finally:
+            # Editing the message doesn't drop the view from the client's
+            # view store; stopping it does.
+            controls.stop()
+            del self._purges[ctx.channel.id]
+
+        summary = f"Cleared {result.deleted} messages."
+        if result.failed:
+            summary += f" {result.failed} could not be deleted."
+        if result.cancelled:
+            summary += f" Cancelled after searching {result.scanned} messages."
+        await status.edit(content=summary, view=None, delete_after=5)
 
     @commands.hybrid_command(description="Mutes a member for a specified duration (in seconds).")
     @has_permissions(moderate_members=True)
-    async def mute(self, ctx: commands.Context, member: discord.Member, duration: int, reason: str = "No reason provided"):
-        senior_moderator_role, junior_moderator_role = self.get_role_mentions()
-
+    async def mute(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], duration: int, reason: str = "No reason provided"):
         try:
-            await member.edit(timed_out_until=discord.utils.utcnow() + datetime.timedelta(seconds=duration))
-            em = discord.Embed(title=f'{member.name} Has been muted for {duration} seconds',
-                               description="Reason: " + reason,
-                               colour=discord.Colour.teal())
+            em = await self.mute_member(ctx.guild, member, ctx.author, duration, reason)
             await ctx.send(embed=em)
-
-            log_channel = self.bot.get_channel(1335611137764626537) 
-            if log_channel:
-                await log_channel.send(f"{senior_moderator_role} {junior_moderator_role}", embed=em)
         except discord.Forbidden:
             await ctx.send("I don't have permission to timeout members.")
         except Exception as e:
             await ctx.send(f"Error: {e}")
             print(e)
 
+    async def mute_member(self, guild: discord.Guild, member: discord.Member, moderator: discord.abc.User,
+                          duration: int, reason: str) -> discord.Embed:
+        # Shared by the mute command and automod. Returns the embed posted to
+        # the mod log.
+        timeout = min(duration, MAX_TIMEOUT)
+        await member.edit(timed_out_until=discord.utils.utcnow() + datetime.timedelta(seconds=timeout))
+        if duration > timeout:
+            now = time.time()
+            await self.scheduler.schedule(guild.id, member.id, "mute", now + timeout - TIMEOUT_RENEW_MARGIN,
+                                          until=now + duration, reason=reason, replace=True)
+        else:
+            await self.scheduler.cancel(guild.id, member.id, "mute")
+        case = self.case_store.record(guild.id, "mute", member.id, moderator.id, reason, duration)
+        em = discord.Embed(title=f'{member.name} Has been muted for {duration} seconds',
+                           description="Reason: " + reason,
+                           colour=discord.Colour.teal())
+        em.set_footer(text=f"Case #{case.case_id}")
+        self.post_mod_log(guild, em)
+        return em
+
     @commands.hybrid_command(description="Unmutes a member.")
     @has_permissions(moderate_members=True)
-    async def unmute(self, ctx: commands.Context, member: discord.Member):
-        senior_moderator_role, junior_moderator_role = self.get_role_mentions()
-
+    async def unmute(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter]):
         try:
             await member.edit(timed_out_until=None)
+            await self.scheduler.cancel(ctx.guild.id, member.id, "mute")
+            case = self.case_store.record(ctx.guild.id, "unmute", member.id, ctx.author.id)
             em = discord.Embed(title=f'{member.name} has been unmuted successfully',
                                colour=discord.Colour.teal())
+            em.set_footer(text=f"Case #{case.case_id}")
             await ctx.send(embed=em)
-
-            log_channel = self.bot.get_channel(1335611137764626537)  
-            if log_channel:
-                await log_channel.send(f"{senior_moderator_role} {junior_moderator_role}", embed=em)
+            self.post_mod_log(ctx.guild, em)
         except discord.Forbidden:
             await ctx.send("I don't have permission to remove timeouts.")
         except Exception as e:
             await ctx.send(f"Error: {e}")
             print(e)
 
+    async def _run_scheduled(self, action: ScheduledAction) -> Optional[float]:
+        # Called by the scheduler for each due action. Returns when to run it
+        # again, for mutes longer than one timeout.
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(action.guild_id)
+        if guild is None:
+            return None
+
+        if action.action == "unban":
+            await guild.unban(discord.Object(action.member_id), reason="Temporary ban expired")
+            case = self.case_store.record(guild.id, "unban", action.member_id, self.bot.user.id,
+                                          "Temporary ban expired")
+            em = discord.Embed(title=f"New Case #{case.case_id} | Unban",
+                               description=f"<@{action.member_id}>'s temporary ban expired.",
+                               colour=discord.Colour.green())
+            self.post_mod_log(guild, em)
+            return None
+
+        member = guild.get_member(action.member_id) or await guild.fetch_member(action.member_id)
+        if action.action == "unwarn":
+            warned = guild.get_role(self.guild_config.get(guild.id).warned_role_id or 0)
+            if warned is not None and warned in member.roles:
+                await member.remove_roles(warned, reason="Warning expired")
+            return None
+
+        if action.action == "mute":
+            remaining = action.until - time.time()
+            if remaining <= 0:
+                return None
+            timeout = min(remaining, MAX_TIMEOUT)
+            await member.edit(timed_out_until=discord.utils.utcnow() + datetime.timedelta(seconds=timeout),
+                              reason=action.reason)
+            return time.time() + timeout - TIMEOUT_RENEW_MARGIN if remaining > timeout else None
+
+        print(f"Unknown scheduled action: {action.action}")
+        return None
+
+    @staticmethod
+    async def _iter_members(guild: discord.Guild) -> AsyncIterator[discord.Member]:
+        if guild.chunked:
+            for member in guild.members:
+                yield member
+        else:
+            # The lean intents profile keeps no member list, so page through it.
+            async for member in guild.fetch_members(limit=None):
+                yield member
+
+    @staticmethod
+    def _can_moderate(ctx: commands.Context, member: discord.Member) -> bool:
+        guild = ctx.guild
+        if member.id in (ctx.author.id, guild.me.id, guild.owner_id):
+            return False
+        if member.top_role >= guild.me.top_role:
+            return False
+        return ctx.author.id == guild.owner_id or member.top_role < ctx.author.top_role
+
+    async def _bulk_targets(self, ctx: commands.Context, members: List[discord.Member],
+                            filters: BulkFilters) -> List[discord.Member]:
+        targets = {member.id: member for member in members}
+        if filters.has_criteria:
+            pattern = re.compile(filters.name, re.IGNORECASE) if filters.name else None
+            now = discord.utils.utcnow()
+            async for member in self._iter_members(ctx.guild):
+                if member.bot or member.id in targets:
+                    continue
+                if filters.joined is not None and (
+                        member.joined_at is None or now - member.joined_at > datetime.timedelta(minutes=filters.joined)):
+                    continue
+                if filters.created is not None and now - member.created_at > datetime.timedelta(days=filters.created):
+                    continue
+                if pattern and not any(pattern.search(name) for name in (member.name, member.nick, member.global_name) if name):
+                    continue
+                targets[member.id] = member
+        return [member for member in targets.values() if self._can_moderate(ctx, member)]
+
+    async def _bulk_action(self, ctx: commands.Context, action: str, members: List[discord.Member],
+                           filters: BulkFilters, perform: Callable[[discord.Member], Awaitable],
+                           colour: discord.Colour,
+                           prepare: Optional[Callable[[], Awaitable]] = None) -> List[discord.Member]:
+        # Returns the members the action succeeded for. `prepare` runs once the
+        # action is confirmed, for setup that shouldn't happen on a preview.
+        if not members and not filters.has_criteria:
+            await ctx.send(":x: Name some members or give a filter such as `joined: 30`.")
+            return []
+        try:
+            targets = await self._bulk_targets(ctx, members, filters)
+        except re.error as e:
+            await ctx.send(f":x: Invalid name pattern: {e}")
+            return []
+
+        if not targets:
+            await ctx.send("No members matched.")
+            return []
+        if len(targets) > self.bulk_limit:
+            await ctx.send(f":x: {len(targets)} members matched, more than the limit of {self.bulk_limit}.")
+            return []
+        if filters.has_criteria and not filters.confirm:
+            preview = ", ".join(str(member) for member in targets[:20])
+            more = f" and {len(targets) - 20} more" if len(targets) > 20 else ""
+            await ctx.send(f"{len(targets)} members would be affected: {preview}{more}.\n"
+                           f"Run the command again with `confirm: yes` to {action} them.")
+            return []
+        if prepare is not None:
+            try:
+                await prepare()
+            except discord.Forbidden:
+                await ctx.send(f"I don't have the permissions needed to {action} members.")
+                return []
+
+        status = await ctx.send(f"Running {action} on {len(targets)} members...")
+        bucket = self._bulk_buckets.get(ctx.guild.id)
+        if bucket is None:
+            bucket = self._bulk_buckets[ctx.guild.id] = TokenBucket(self.bulk_rate, 1.0)
+        succeeded, failed = await run_bulk(
+            targets, perform, concurrency=self.bulk_concurrency, bucket=bucket,
+            progress=lambda done, total: status.edit(content=f"Running {action} on {total} members... ({done}/{total})")
+        )
+
+        cases = [self.case_store.record(ctx.guild.id, action, member.id, ctx.author.id, filters.reason,
+                                        filters.duration if action == "mute" else None)
+                 for member in succeeded]
+        summary = f"{action.title()}: {len(succeeded)} succeeded"
+        summary += f", {len(failed)} failed." if failed else "."
+        await status.edit(content=summary)
+
+        log_embed = discord.Embed(title=f"Mass {action.title()} | {len(succeeded)} members", colour=colour)
+        log_embed.add_field(name="Moderator", value=f'{ctx.author}')
+        log_embed.add_field(name="Reason", value=filters.reason)
+        if cases:
+            log_embed.add_field(name="Cases", value=f"#{cases[0].case_id}–#{cases[-1].case_id}")
+        mentions = ""
+        for i, member in enumerate(succeeded):
+            if len(mentions) + len(member.mention) > 1000:
+                mentions += f"… and {len(succeeded) - i} more"
+                break
+            mentions += f"{member.mention} "
+        log_embed.add_field(name="Members", value=mentions or "None", inline=False)
+        if failed:
+            log_embed.add_field(name="Failed", value=str(len(failed)))
+        self.post_mod_log(ctx.guild, log_embed)
+        return succeeded
+
+    @commands.command(name="masskick", description="Kicks many members at once.")
+    @commands.guild_only()
+    @has_permissions(kick_members=True)
+    async def mass_kick(self, ctx: commands.Context, members: commands.Greedy[CachedMemberConverter], *,
+                        filters: BulkFilters):
+        await self._bulk_action(ctx, "kick", members, filters,
+                                lambda member: member.kick(reason=filters.reason), discord.Colour.red())
+
+    @commands.command(name="massmute", description="Times out many members at once.")
+    @commands.guild_only()
+    @has_permissions(moderate_members=True)
+    async def mass_mute(self, ctx: commands.Context, members: commands.Greedy[CachedMemberConverter], *,
+                        filters: BulkFilters):
+        if not 0 < filters.duration <= 28 * 86400:
+            return await ctx.send(":x: Timeouts must be between 1 second and 28 days.")
+        until = discord.utils.utcnow() + datetime.timedelta(seconds=filters.duration)
+        await self._bulk_action(ctx, "mute", members, filters,
+                                lambda member: member.edit(timed_out_until=until, reason=filters.reason),
+                                discord.Colour.teal())
+
+    @commands.command(name="masswarn", description="Warns many members at once.")
+    @commands.guild_only()
+    @has_permissions(ban_members=True)
+    async def mass_warn(self, ctx: commands.Context, members: commands.Greedy[CachedMemberConverter], *,
+                        filters: BulkFilters):
+        warned = None
+
+        async def resolve_role():
+            # Only after confirmation, so a preview never creates the role.
+            nonlocal warned
+            warned = await self.get_warned_role(ctx.guild)
+
+        succeeded = await self._bulk_action(ctx, "warn", members, filters,
+                                            lambda member: member.add_roles(warned, reason=filters.reason),
+                                            discord.Colour.orange(), prepare=resolve_role)
+        if self.warn_expiry > 0:
+            expires = time.time() + self.warn_expiry
+            await self.scheduler.schedule_many(
+                ((ctx.guild.id, member.id, "unwarn", expires, None, None) for member in succeeded), replace=True
+            )
+
+    @commands.hybrid_command(description="Shows or changes the moderation log channel and moderator roles.")
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    async def modconfig(self, ctx: commands.Context, log_channel: Optional[discord.TextChannel] = None,
+                        senior_role: Optional[discord.Role] = None, junior_role: Optional[discord.Role] = None):
+        changes = {}
+        if log_channel is not None:
+            changes['log_channel_id'] = log_channel.id
+        if senior_role is not None:
+            changes['senior_role_id'] = senior_role.id
+        if junior_role is not None:
+            changes['junior_role_id'] = junior_role.id
+        if changes:
+            await self.guild_config.update(ctx.guild.id, **changes)
+
+        config = self.guild_config.get(ctx.guild.id)
+        em = discord.Embed(title="Moderation config" + (" updated" if changes else ""),
+                           colour=discord.Colour.blurple())
+        em.add_field(name="Log channel", value=f"<#{config.log_channel_id}>" if config.log_channel_id else "None")
+        em.add_field(name="Senior moderators", value=f"<@&{config.senior_role_id}>")
+        em.add_field(name="Junior moderators", value=f"<@&{config.junior_role_id}>")
+        em.add_field(name="Warned role", value=f"<@&{config.warned_role_id}>" if config.warned_role_id else "Not created yet")
+        await ctx.send(embed=em)
+
+    @commands.hybrid_command(description="Shows a member's moderation history.")
+    @has_permissions(moderate_members=True)
+    async def cases(self, ctx: commands.Context, member: discord.User):
+        total, recent = await self.case_store.member_cases(ctx.guild.id, member.id)
+        em = discord.Embed(title=f"Cases for {member}",
+                           description=f"{total} case(s) on record." if total else "No cases on record.",
+                           colour=discord.Colour.blurple())
+        for case in recent:
+            details = f"By <@{case.moderator_id}> <t:{int(case.created_at)}:R>"
+            if case.duration:
+                details += f" for {case.duration}s"
+            em.add_field(name=f"#{case.case_id} | {case.action.title()}",
+                         value=f"{details}\nReason: {case.reason or 'No reason provided'}",
+                         inline=False)
+        if total > len(recent):
+            em.set_footer(text=f"Showing the {len(recent)} most recent cases.")
+        await ctx.send(embed=em)
+
+    @commands.hybrid_command(description="Shows moderation activity for a moderator or the whole team.")
+    @has_permissions(moderate_members=True)
+    async def modstats(self, ctx: commands.Context, moderator: Optional[discord.User] = None, days: int = 30):
+        since = time.time() - days * 86400
+        if moderator is not None:
+            counts = await self.case_store.moderator_stats(ctx.guild.id, moderator.id, since)
+            em = discord.Embed(title=f"Moderation stats for {moderator}",
+                               description=f"Last {days} days: {sum(counts.values())} action(s)",
+                               colour=discord.Colour.blurple())
+            for action, count in sorted(counts.items()):
+                em.add_field(name=action.title(), value=str(count))
+        else:
+            top = await self.case_store.top_moderators(ctx.guild.id, since)
+            em = discord.Embed(title="Moderation stats",
+                               description="\n".join(f"<@{moderator_id}>: {count} action(s)" for moderator_id, count in top)
+                                           or "No actions recorded.",
+                               colour=discord.Colour.blurple())
+            em.set_footer(text=f"Last {days} days")
+        await ctx.send(embed=em)
+
 async def setup(bot):
     await bot.add_cog(ModCog(bot))
\ No newline at end of file
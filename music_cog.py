@@ -1,69 +1,331 @@
 import asyncio
+import functools
+import json
+import os
 import random
 import re
+import time
 import traceback
-from typing import Optional, List, Dict
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterable, Optional, List, Dict, Deque, Iterator
 
 import discord
-import yt_dlp
-import lyricsgenius
-import requests
-from discord.ext import commands, pages
+from discord.ext import commands, pages, tasks
+
+from audio_cache import AudioCache
+from audio_dsp import DSP_AVAILABLE, DSPAudioSource, measure_loudness, normalization_gain
+from lyrics_service import LyricsService
+from track_cache import TrackCache
+from track_enricher import TrackEnricher
+from track_resolver import TrackResolver
+from track_search import SearchEngine
+from metrics import (FFMPEG_EXITS, FFMPEG_LIFETIME, FRAME_UNDERRUNS, REGISTRY, TIME_TO_FIRST_AUDIO)
+from queue_journal import QueueJournal
 
 class TrackInfo:
+    __slots__ = ('title', 'url', 'duration', 'thumbnail', 'id', 'requester_id', 'artist', 'loudness')
+
     def __init__(self, data: Dict):
         self.title = data.get('title', 'Unknown Track')
         self.url = data.get('webpage_url')
         self.duration = data.get('duration', 0)
         self.thumbnail = data.get('thumbnail')
-        self.stream_url = data.get('url')
         self.id = data.get('id')
-        self.requester = data.get('requester')
+        requester = data.get('requester')
+        self.requester_id = requester.id if requester is not None else data.get('requester_id')
         self.artist = data.get('artist')
+        self.loudness = data.get('loudness')
+
+    @property
+    def requester_mention(self) -> str:
+        return f"<@{self.requester_id}>" if self.requester_id else "Unknown"
+
+    def to_dict(self) -> Dict:
+        # Same keys the constructor reads, without the empty ones.
+        data = {'title': self.title, 'webpage_url': self.url, 'duration': self.duration, 'thumbnail': self.thumbnail,
+                'id': self.id, 'requester_id': self.requester_id, 'artist': self.artist, 'loudness': self.loudness}
+        return {key: value for key, value in data.items() if value is not None}
+
+Journal = Callable[[Dict], None]
 
 class MusicQueue:
-    def __init__(self):
-        self._queue: List[TrackInfo] = []
-        self._history: List[TrackInfo] = []
+    def __init__(self, history_size: int = 50, journal: Optional[Journal] = None):
+        self._queue: Deque[TrackInfo] = deque()
+        self._history: Deque[TrackInfo] = deque(maxlen=history_size)
+        self.journal = journal
+        # The last track handed out by next() until playback of it starts.
+        self.taken: Optional[TrackInfo] = None
+
+    def _log(self, entry: Dict):
+        if self.journal is not None:
+            self.journal(entry)
 
     def add(self, track: TrackInfo):
         self._queue.append(track)
+        self._log({'op': 'add', 'track': track.to_dict()})
+
+    def add_next(self, track: TrackInfo):
+        self._queue.appendleft(track)
+        self._log({'op': 'add_next', 'track': track.to_dict()})
+
+    def restore(self, tracks: Iterable[TrackInfo]):
+        # Refills the queue from the journal without journaling it again.
+        self._queue.extend(tracks)
 
     def next(self) -> Optional[TrackInfo]:
         if not self._queue:
             return None
-        track = self._queue.pop(0)
+        track = self._queue.popleft()
         self._history.append(track)
+        self.taken = track
+        self._log({'op': 'next'})
+        return track
+
+    def remove(self, index: int) -> TrackInfo:
+        # deque rotates towards the nearer end, so this is O(min(i, n - i)).
+        track = self._queue[index]
+        del self._queue[index]
+        self._log({'op': 'remove', 'index': index})
+        return track
+
+    def move(self, source: int, destination: int) -> TrackInfo:
+        track = self._queue[source]
+        del self._queue[source]
+        self._queue.insert(destination, track)
+        self._log({'op': 'move', 'from': source, 'to': destination})
         return track
 
     def clear(self):
         self._queue.clear()
+        self._log({'op': 'clear'})
 
     def shuffle(self):
-        random.shuffle(self._queue)
+        tracks = list(self._queue)
+        random.shuffle(tracks)
+        self._queue = deque(tracks)
+        self._log({'op': 'shuffle'})
 
     def __len__(self):
         return len(self._queue)
 
-    def get_queue(self):
-        return self._queue.copy()
+    def __iter__(self) -> Iterator[TrackInfo]:
+        return iter(self._queue)
+
+    def get_queue(self) -> List[TrackInfo]:
+        return list(self._queue)
+
+    def get_history(self) -> List[TrackInfo]:
+        return list(self._history)
+
+    def peek(self, count: int = 1) -> List[TrackInfo]:
+        return list(islice(self._queue, count))
+
+class PlaybackSource(discord.AudioSource):
+    # Thin wrapper that remembers how the FFmpeg process was started and how
+    # far playback has got, so the source can be restarted at the same spot.
+    # It also reports time-to-first-audio, slow frames and FFmpeg exits.
+    FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+    def __init__(self, source: discord.AudioSource, volume: float, offset: float = 0.0, normalization: float = 1.0,
+                 kind: str = "stream", guild_id: Optional[int] = None):
+        self.source = source
+        self.volume = volume
+        self.offset = offset
+        self.normalization = normalization
+        self.kind = kind
+        self.guild_id = guild_id
+        self.frames = 0
+        self.created_at = self.requested_at = time.perf_counter()
+        self._cleaned_up = False
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.frames * self.FRAME_SECONDS
+
+    def read(self) -> bytes:
+        started = time.perf_counter()
+        data = self.source.read()
+        if self.frames == 0:
+            TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - self.requested_at, source=self.kind)
+        elif data and time.perf_counter() - started > self.FRAME_SECONDS:
+            FRAME_UNDERRUNS.inc(guild=self.guild_id)
+        self.frames += 1
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def _ffmpeg_process(self):
+        source = self.source
+        while not isinstance(source, discord.FFmpegAudio) and hasattr(source, 'original'):
+            source = source.original
+        return getattr(source, '_process', None)
+
+    def cleanup(self):
+        if self._cleaned_up:
+            return
+        self._cleaned_up = True
+        process = self._ffmpeg_process()
+        self.source.cleanup()
+        if process is not None:
+            FFMPEG_LIFETIME.observe(time.perf_counter() - self.created_at)
+            FFMPEG_EXITS.inc(code=process.returncode)
+
+class GuildPlayer:
+    def __init__(self, guild_id: int, volume: float = 1.0, history_size: int = 50, journal: Optional[Journal] = None):
+        self.guild_id = guild_id
+        self.queue = MusicQueue(history_size, journal)
+        self.journal = journal
+        self.current_track: Optional[TrackInfo] = None
+        self.voice_client: Optional[discord.VoiceClient] = None
+        self.text_channel_id: Optional[int] = None
+        self.is_loop = False
+        self.is_playing = False
+        # Set while _play_track is connecting and opening a source, before
+        # is_playing is; requests arriving then are queued behind it.
+        self.starting = False
+        self.volume = volume
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self.warm_track: Optional[TrackInfo] = None
+        self.warm_source: Optional[PlaybackSource] = None
+        self.now_playing_message: Optional[discord.Message] = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self.is_playing or self.starting
+
+    def is_idle(self, timeout: float) -> bool:
+        if self.busy or time.monotonic() - self.last_active < timeout:
+            return False
+        return not (self.voice_client and self.voice_client.is_playing())
+
+    def take_warm_source(self, track: TrackInfo) -> Optional[PlaybackSource]:
+        source, warm_track = self.warm_source, self.warm_track
+        self.warm_source = self.warm_track = None
+        if source is not None and warm_track is track and source.volume == self.volume:
+            return source
+        if source is not None:
+            source.cleanup()
+        return None
+
+    def cancel_prefetch(self):
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+        if self.warm_source is not None:
+            self.warm_source.cleanup()
+        self.warm_source = self.warm_track = None
+
+    def position(self) -> float:
+        source = self.voice_client.source if self.voice_client else None
+        return source.position if isinstance(source, PlaybackSource) else 0.0
+
+    def snapshot(self) -> Dict:
+        # A track already taken off the queue but not yet playing goes in as
+        # the current one, so a crash before its 'play' entry can't lose it.
+        if self.queue.taken is not None:
+            current, position = self.queue.taken, 0.0
+        else:
+            current, position = self.current_track, round(self.position(), 1)
+        return {
+            'current': current.to_dict() if current else None,
+            't': position,
+            'queue': [track.to_dict() for track in self.queue],
+            'voice': self.voice_client.channel.id if self.voice_client else None,
+            'text': self.text_channel_id,
+            'volume': self.volume,
+            'loop': self.is_loop,
+        }
+
+    def log(self, entry: Dict):
+        if self.journal is not None:
+            self.journal(entry)
+
+    def end_session(self):
+        self.current_track = None
+        self.queue.taken = None
+        self.log({'op': 'end'})
+
+    def reset(self):
+        self.cancel_prefetch()
+        self.queue.clear()
+        self.end_session()
+        self.now_playing_message = None
+        self.is_playing = False
+
+class ResumeContext:
+    # Stands in for the command context when a session is resumed after a
+    # restart. The bot itself is the "author", so the voice checks in
+    # _play_track see the channel it rejoined.
+    def __init__(self, guild: discord.Guild, channel: discord.abc.Messageable):
+        self.guild = guild
+        self.channel = channel
+
+    @property
+    def author(self) -> discord.Member:
+        return self.guild.me
+
+    @property
+    def voice_client(self) -> Optional[discord.VoiceClient]:
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs) -> discord.Message:
+        return await self.channel.send(*args, **kwargs)
+
+class SearchPicker(discord.ui.View):
+    def __init__(self, cog: "Music", ctx: commands.Context, results: List[Dict]):
+        super().__init__(timeout=120)
+        self.cog = cog
+        self.ctx = ctx
+        self.results = results
+        self.select = discord.ui.Select(
+            placeholder="Pick a track to play",
+            options=[
+                discord.SelectOption(label=f"{i}. {result['title']}"[:100], value=str(i - 1))
+                for i, result in enumerate(results, 1)
+            ]
+        )
+        self.select.callback = self.pick
+        self.add_item(self.select)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.ctx.author.id
+
+    async def pick(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        result = self.results[int(self.select.values[0])]
+        try:
+            await self.cog._play_search_result(self.ctx, result)
+        except ValueError as ve:
+            await self.ctx.send(embed=discord.Embed(
+                title="Track Error", 
+                description=str(ve), 
+                color=0xe74c3c
+            ))
 
 class Music(commands.Cog):
     def __init__(self, client):
         self.client = client
-        self.queue = MusicQueue()
-        self.current_track = None
-        self.voice_client = None
-        self.is_loop = False
-        self.is_playing = False
-        self.volume = 1.0
+        self.players: Dict[int, GuildPlayer] = {}
+        self.default_volume = 1.0
+        self.player_idle_timeout = float(os.getenv("PLAYER_IDLE_TIMEOUT", "300"))
+        self.history_size = int(os.getenv("MUSIC_HISTORY_SIZE", "50"))
         
-        try:
-            self.genius = lyricsgenius.Genius("")
-            self.genius.verbose = False
-            self.genius.remove_section_headers = True
-        except:
-            self.genius = None
+        genius_token = os.getenv("GENIUS_ACCESS_TOKEN")
+        self.lyrics = LyricsService(
+            lambda: self._create_genius(genius_token),
+            path=os.getenv("LYRICS_CACHE_PATH", "cache/lyrics.db")
+        ) if genius_token else None
+        self.enricher = TrackEnricher(
+            self.lyrics,
+            self._track_enriched,
+            concurrency=int(os.getenv("ENRICH_CONCURRENCY", "2"))
+        ) if self.lyrics else None
 
         self.YDL_OPTIONS = {
             'format': 'bestaudio/best',
@@ -79,11 +341,174 @@ class Music(commands.Cog):
             'no_warnings': True,
         }
 
+        self.resolver = TrackResolver(
+            self.YDL_OPTIONS,
+            max_workers=int(os.getenv("YTDL_WORKERS", "4")),
+            use_processes=os.getenv("YTDL_EXECUTOR", "thread") == "process",
+            timeout=float(os.getenv("YTDL_TIMEOUT", "20"))
+        )
+        self.playlist_concurrency = int(os.getenv("PLAYLIST_CONCURRENCY", str(self.resolver.max_workers)))
+        self.prefetch_count = int(os.getenv("PREFETCH_TRACKS", "2"))
+        self.prewarm_lead = float(os.getenv("PREWARM_SECONDS", "10"))
+        audio_cache_mb = int(os.getenv("AUDIO_CACHE_MAX_MB", "0"))
+        self.audio_cache = AudioCache(
+            directory=os.getenv("AUDIO_CACHE_DIR", "cache/audio"),
+            max_bytes=audio_cache_mb * 1024 * 1024,
+            policy=os.getenv("AUDIO_CACHE_POLICY", "lru"),
+            min_plays=int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "2"))
+        ) if audio_cache_mb > 0 else None
+        self.audio_cache_max_duration = int(os.getenv("AUDIO_CACHE_MAX_DURATION", "1800"))
+        self._background_tasks = set()
+        self.search_engine = SearchEngine(self.resolver, ttl=float(os.getenv("SEARCH_CACHE_TTL", "600")))
+        self.track_cache = TrackCache(
+            path=os.getenv("TRACK_CACHE_PATH", "cache/tracks.db"),
+            memory_size=int(os.getenv("TRACK_CACHE_SIZE", "512"))
+        )
+
+        self.playback_mode = os.getenv("PLAYBACK_MODE", "opus")
+        if self.playback_mode == "dsp" and not DSP_AVAILABLE:
+            print("PLAYBACK_MODE=dsp needs numpy; falling back to pcm")
+            self.playback_mode = "pcm"
+        self.loudness_target = float(os.getenv("LOUDNESS_TARGET", "-14")) if os.getenv("LOUDNESS_NORMALIZATION") == "1" else None
+        self._loudness_semaphore = asyncio.Semaphore(int(os.getenv("LOUDNESS_CONCURRENCY", "1")))
+        self.loudness_max_duration = int(os.getenv("LOUDNESS_MAX_DURATION", "3600"))
+        self._measuring = set()
+
         self.FFMPEG_OPTIONS = {
             'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
             'options': '-vn'
         }
 
+        self.queue_journal = QueueJournal(
+            directory=os.getenv("QUEUE_JOURNAL_DIR", "data/queues"),
+            snapshot=lambda guild_id: self.players[guild_id].snapshot() if guild_id in self.players else None
+        ) if os.getenv("QUEUE_RESUME", "1") != "0" else None
+        self.resume_concurrency = int(os.getenv("RESUME_CONCURRENCY", "5"))
+
+    @staticmethod
+    def _create_genius(token: str):
+        import lyricsgenius
+        genius = lyricsgenius.Genius(token)
+        genius.verbose = False
+        genius.remove_section_headers = True
+        return genius
+
+    async def cog_load(self):
+        await self.track_cache.prune()
+        if self.audio_cache:
+            await self.audio_cache.load()
+        self.evict_idle_players.start()
+        if self.enricher:
+            self.enricher.start()
+        if self.queue_journal:
+            self.queue_journal.start()
+            self.checkpoint_positions.start()
+            self._run_in_background(self._restore_sessions())
+        REGISTRY.add_collector(self._collect_metrics)
+
+    def cog_unload(self):
+        REGISTRY.remove_collector(self._collect_metrics)
+        self.evict_idle_players.cancel()
+        if self.enricher:
+            self.enricher.close()
+        if self.queue_journal:
+            self.checkpoint_positions.cancel()
+            self._checkpoint_positions()
+            self.queue_journal.close()
+        for player in self.players.values():
+            player.cancel_prefetch()
+        self.players.clear()
+        self.resolver.close()
+        self.track_cache.close()
+        if self.lyrics:
+            self.lyrics.close()
+        for task in self._background_tasks:
+            task.cancel()
+        if self.audio_cache:
+            self.audio_cache.close()
+
+    async def cog_check(self, ctx: commands.Context):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        return True
+
+    def get_player(self, guild: discord.Guild) -> GuildPlayer:
+        player = self.players.get(guild.id)
+        if player is None:
+            journal = functools.partial(self.queue_journal.record, guild.id) if self.queue_journal else None
+            player = self.players[guild.id] = GuildPlayer(guild.id, volume=self.default_volume,
+                                                          history_size=self.history_size, journal=journal)
+        player.touch()
+        return player
+
+    def _checkpoint_positions(self):
+        for player in self.players.values():
+            voice_client = player.voice_client
+            if player.current_track and voice_client and voice_client.is_playing():
+                player.log({'op': 'pos', 't': round(player.position(), 1)})
+
+    @tasks.loop(seconds=10)
+    async def checkpoint_positions(self):
+        # A crash loses at most this interval of the current track's progress.
+        self._checkpoint_positions()
+
+    async def _restore_sessions(self):
+        sessions = await self.queue_journal.load()
+        if not sessions:
+            return
+        await self.client.wait_until_ready()
+        semaphore = asyncio.Semaphore(self.resume_concurrency)
+
+        async def resume(guild_id: int, session: Dict):
+            async with semaphore:
+                try:
+                    await self._resume_session(guild_id, session)
+                except Exception as e:
+                    print(f"Resuming the queue for guild {guild_id} failed: {e}")
+
+        await asyncio.gather(*(resume(guild_id, session) for guild_id, session in sessions.items()))
+
+    async def _resume_session(self, guild_id: int, session: Dict):
+        # Tracks come back from the journal as stored metadata; only the stream
+        # URL is looked up again, and from the track cache while it is fresh.
+        guild = self.client.get_guild(guild_id)
+        voice_channel = guild.get_channel(session['voice']) if guild and session['voice'] else None
+        text_channel = guild.get_channel(session['text']) if guild and session['text'] else None
+        listeners = [member for member in voice_channel.members if not member.bot] if voice_channel else []
+        if not listeners or text_channel is None or not (session['current'] or session['queue']):
+            self.queue_journal.record(guild_id, {'op': 'end'})
+            return
+
+        player = self.get_player(guild)
+        player.volume = session['volume']
+        player.is_loop = session['loop']
+        player.text_channel_id = text_channel.id
+        player.queue.restore(TrackInfo(track) for track in session['queue'])
+
+        ctx = ResumeContext(guild, text_channel)
+        if not ctx.voice_client:
+            await voice_channel.connect()
+        if session['current']:
+            track, offset = TrackInfo(session['current']), session['t']
+        else:
+            track, offset = player.queue.next(), 0.0
+        await self._play_track(ctx, track, offset=offset)
+        await ctx.send(embed=discord.Embed(
+            title="Session Resumed",
+            description=f"Picked up where playback left off with {len(player.queue)} track(s) queued.",
+            color=0x2ecc71
+        ))
+
+    @tasks.loop(minutes=1)
+    async def evict_idle_players(self):
+        for guild_id, player in list(self.players.items()):
+            if not player.is_idle(self.player_idle_timeout):
+                continue
+            player.reset()
+            if player.voice_client and player.voice_client.is_connected():
+                await player.voice_client.disconnect()
+            self.players.pop(guild_id, None)
+
     @staticmethod
     def format_duration(seconds: Optional[int]) -> str:
         if not seconds:
@@ -100,43 +525,258 @@ class Music(commands.Cog):
         
         return " ".join(parts)
 
-    def _fetch_track_info(self, query: str, requester: discord.Member):
+    @staticmethod
+    def _artist_from(info: Dict) -> Optional[str]:
+        # "Artist - Title" uploads name the artist; otherwise the uploader
+        # stands in for it.
+        title_parts = (info.get('title') or '').split('-')
+        artist = title_parts[0].strip() if len(title_parts) > 1 else None
+        return artist or info.get('uploader')
+
+    async def _fetch_track_info(self, query: str, requester: discord.Member):
         try:
-            with yt_dlp.YoutubeDL(self.YDL_OPTIONS) as ydl:
-                info = ydl.extract_info(query, download=False)
-        
+            entry = await self.track_cache.get(query)
+            if entry is not None:
+                track = TrackInfo(dict(entry, requester=requester))
+                self._enrich(track)
+                return track
+
+            info = await self.resolver.extract(query)
+
             if 'entries' in info:
                 info = info['entries'][0]
-        
-            artist = None
-            if self.genius:
-                try:
-                    title_parts = info.get('title', '').split('-')
-                    if len(title_parts) > 1:
-                        artist = title_parts[0].strip()
-                
-                    if not artist:
-                        song = self.genius.search_song(info.get('title', ''))
-                        artist = song.artist if song else None
-                except Exception as e:
-                    print(f"Lyrics search error: {e}")
 
-            return TrackInfo({
+            entry = await self.track_cache.put(query, {
                 'title': info.get('title', 'Unknown Track'),
                 'webpage_url': info.get('webpage_url'),
                 'duration': info.get('duration'),
                 'thumbnail': info.get('thumbnail'),
                 'url': info.get('url'),
                 'id': info.get('id'),
-                'requester': requester,
-                'artist': artist or info.get('uploader')
+                'artist': self._artist_from(info)
             })
+            track = TrackInfo(dict(entry, requester=requester))
+            self._enrich(track)
+            return track
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             print(f"Track retrieval failed: {e}")
             print(traceback.format_exc())
             raise ValueError(f"Track retrieval failed: {str(e)}")
 
-    async def _play_track(self, ctx: commands.Context, track: TrackInfo):
+    def _enrich(self, track: TrackInfo):
+        # Artist lookups never block resolution; the Genius artist is filled
+        # in later by the enricher when the title doesn't carry one.
+        if self.enricher and '-' not in track.title:
+            self.enricher.submit(track)
+
+    async def _track_enriched(self, track_id: str, artist: str):
+        entry = await self.track_cache.get_by_id(track_id)
+        if entry is not None and entry['artist'] != artist:
+            await self.track_cache.put(None, dict(entry, artist=artist))
+
+        for player in self.players.values():
+            track = player.current_track
+            if track and track.id == track_id and player.now_playing_message:
+                try:
+                    await player.now_playing_message.edit(embed=self._now_playing_embed(track))
+                except discord.HTTPException as e:
+                    print(f"Could not update Now Playing message: {e}")
+
+    def _now_playing_embed(self, track: TrackInfo, title: str = "🎵 Now Playing") -> discord.Embed:
+        embed = discord.Embed(
+            title=title, 
+            description=f"**{track.title}**\n"
+                        f"Artist: {track.artist or 'Unknown'}\n"
+                        f"Duration: {self.format_duration(track.duration)}\n"
+                        f"Requested by: {track.requester_mention}",
+            color=0x2ecc71
+        )
+        embed.set_thumbnail(url=track.thumbnail)
+        return embed
+
+    async def _resolve_stream(self, track: TrackInfo) -> str:
+        # Queue entries only carry the track identity; the signed stream URL is
+        # looked up (or re-extracted) right before it is needed.
+        margin = min(track.duration or 0, 3600) + 60
+        entry = await self.track_cache.get_by_id(track.id) if track.id else None
+        if entry is not None and self.track_cache.stream_fresh(entry, margin):
+            return entry['url']
+
+        try:
+            info = await self.resolver.extract(track.url or track.id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Stream retrieval failed: {str(e)}")
+
+        if 'entries' in info:
+            info = info['entries'][0]
+        if entry is not None:
+            entry = await self.track_cache.update_stream(entry, info.get('url'))
+        else:
+            entry = await self.track_cache.put(None, dict(info, artist=track.artist))
+        return entry['url']
+
+    async def _create_source(self, track: TrackInfo, volume: float, offset: float = 0.0,
+                             guild_id: Optional[int] = None) -> PlaybackSource:
+        before_options = self.FFMPEG_OPTIONS['before_options']
+        options = self.FFMPEG_OPTIONS['options']
+        codec = None
+        path = await self.audio_cache.lookup(track.id) if self.audio_cache and track.id else None
+        if path:
+            source_input, before_options, codec = path, '', 'opus'
+        else:
+            source_input = await self._resolve_stream(track)
+        if offset:
+            before_options = f"{before_options} -ss {offset:.2f}".strip()
+
+        normalization = 1.0
+        if self.loudness_target is not None:
+            if track.loudness is None and track.id:
+                entry = await self.track_cache.get_by_id(track.id)
+                track.loudness = entry['loudness'] if entry else None
+            normalization = normalization_gain(track.loudness, self.loudness_target)
+
+        kind = self.playback_mode
+        if self.playback_mode == "pcm":
+            source = discord.PCMVolumeTransformer(
+                discord.FFmpegPCMAudio(source_input, before_options=before_options, options=options),
+                volume=volume * normalization
+            )
+        elif self.playback_mode == "dsp":
+            source = DSPAudioSource(
+                discord.FFmpegPCMAudio(source_input, before_options=before_options, options=options),
+                volume=volume,
+                normalization=normalization
+            )
+        elif volume * normalization != 1.0:
+            # FFmpeg applies the gain while it encodes to Opus, instead of
+            # Python scaling every PCM frame and encoding it again.
+            source = discord.FFmpegOpusAudio(
+                source_input,
+                before_options=before_options,
+                options=f"{options} -filter:a volume={volume * normalization:.3f}"
+            )
+        elif codec == 'opus':
+            kind = "passthrough"
+            source = discord.FFmpegOpusAudio(source_input, codec='copy', before_options=before_options, options=options)
+        else:
+            # Opus inputs (most YouTube audio formats) are passed through
+            # without decoding; anything else is encoded once by FFmpeg.
+            source = await discord.FFmpegOpusAudio.from_probe(source_input, before_options=before_options, options=options)
+        if path:
+            kind = f"cache-{kind}"
+        return PlaybackSource(source, volume, offset, normalization, kind=kind, guild_id=guild_id)
+
+    async def _apply_volume(self, voice_client: discord.VoiceClient, player: GuildPlayer, source: PlaybackSource):
+        if isinstance(source.source, discord.PCMVolumeTransformer):
+            source.source.volume = player.volume * source.normalization
+            source.volume = player.volume
+            return
+        if isinstance(source.source, DSPAudioSource):
+            # The DSP stage ramps to the new gain on its own.
+            source.source.volume = source.volume = player.volume
+            return
+
+        # The gain is baked into the FFmpeg process, so restart it at the
+        # current position with the new volume and swap it in.
+        paused = voice_client.is_paused()
+        new_source = await self._create_source(
+            player.current_track, player.volume, offset=source.position, guild_id=player.guild_id)
+        if voice_client.source is not source:
+            new_source.cleanup()
+            return
+        voice_client.source = new_source
+        source.cleanup()
+        if paused:
+            voice_client.pause()
+
+    async def _fill_audio_cache(self, track: TrackInfo):
+        try:
+            stream_url = await self._resolve_stream(track)
+            await self.audio_cache.fill(track.id, stream_url, self.FFMPEG_OPTIONS['before_options'])
+        except (ValueError, OSError) as e:
+            print(f"Audio cache fill failed for {track.title}: {e}")
+
+    async def _measure_loudness(self, track: TrackInfo):
+        self._measuring.add(track.id)
+        try:
+            async with self._loudness_semaphore:
+                path = await self.audio_cache.lookup(track.id) if self.audio_cache else None
+                if path:
+                    loudness = await measure_loudness(path)
+                else:
+                    loudness = await measure_loudness(
+                        await self._resolve_stream(track),
+                        self.FFMPEG_OPTIONS['before_options']
+                    )
+            if loudness is not None:
+                track.loudness = loudness
+                await self.track_cache.set_loudness(track.id, loudness)
+        except (ValueError, OSError) as e:
+            print(f"Loudness measurement failed for {track.title}: {e}")
+        finally:
+            self._measuring.discard(track.id)
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _record_play(self, track: TrackInfo):
+        # Tracks are encoded to disk and measured for loudness in the
+        # background; live streams and very long uploads are skipped, with a
+        # separate length limit for each.
+        if not track.id or not track.duration:
+            return
+        if (self.loudness_target is not None and track.loudness is None and track.id not in self._measuring
+                and track.duration <= self.loudness_max_duration):
+            self._run_in_background(self._measure_loudness(track))
+        if (self.audio_cache and track.duration <= self.audio_cache_max_duration
+                and await self.audio_cache.record_play(track.id)):
+            self._run_in_background(self._fill_audio_cache(track))
+
+    async def _prefetch(self, player: GuildPlayer, current: TrackInfo):
+        upcoming = player.queue.peek(self.prefetch_count)
+        for track in upcoming:
+            if self.audio_cache and track.id and self.audio_cache.contains(track.id):
+                continue
+            try:
+                await self._resolve_stream(track)
+            except ValueError as e:
+                print(f"Prefetch failed for {track.title}: {e}")
+
+        if not upcoming or not current.duration:
+            return
+
+        # Spawn FFmpeg for the next track shortly before the current one ends,
+        # so the input is already opened and probed when playback switches.
+        # The wait follows the playback position rather than the wall clock,
+        # so resumed offsets, restarts and pauses are accounted for.
+        while True:
+            if player.current_track is not current:
+                return
+            remaining = current.duration - player.position() - self.prewarm_lead
+            paused = player.voice_client is not None and player.voice_client.is_paused()
+            if remaining <= 0 and not paused:
+                break
+            await asyncio.sleep(max(remaining, self.prewarm_lead, 1.0) if paused else remaining)
+        next_tracks = player.queue.peek(1)
+        if not next_tracks:
+            return
+        try:
+            player.warm_source = await self._create_source(next_tracks[0], player.volume, guild_id=player.guild_id)
+            player.warm_track = next_tracks[0]
+        except Exception as e:
+            print(f"Prewarm failed for {next_tracks[0].title}: {e}")
+
+    async def _play_track(self, ctx: commands.Context, track: TrackInfo, requested_at: Optional[float] = None,
+                          offset: float = 0.0):
+        requested_at = requested_at or time.perf_counter()
+        player = self.get_player(ctx.guild)
+        player.starting = True
         try:
             if not ctx.author.voice or not ctx.author.voice.channel:
                 if ctx.voice_client:
@@ -145,18 +785,29 @@ class Music(commands.Cog):
 
             if not ctx.voice_client:
                 await ctx.author.voice.channel.connect()
+            player.voice_client = ctx.voice_client
 
             if ctx.voice_client.is_playing():
                 ctx.voice_client.stop()
 
+            source = player.take_warm_source(track)
+            player.cancel_prefetch()
+
             try:
-                source = discord.FFmpegPCMAudio(
-                    track.stream_url, 
-                    **self.FFMPEG_OPTIONS
-                )
-                
-                volume_controlled = discord.PCMVolumeTransformer(source, volume=self.volume)
-                
+                if source is None:
+                    source = await self._create_source(track, player.volume, offset, guild_id=player.guild_id)
+                source.requested_at = requested_at
+            except ValueError as stream_error:
+                print(f"Stream Error: {stream_error}")
+                await ctx.send(embed=discord.Embed(
+                    title="Playback Error", 
+                    description=f"Skipping **{track.title}**: {str(stream_error)}", 
+                    color=0xe74c3c
+                ))
+                next_track = player.queue.next()
+                if next_track:
+                    await self._play_track(ctx, next_track)
+                return
             except Exception as ffmpeg_error:
                 print(f"FFmpeg Error: {ffmpeg_error}")
                 await ctx.send(embed=discord.Embed(
@@ -168,7 +819,7 @@ class Music(commands.Cog):
 
             try:
                 ctx.voice_client.play(
-                    volume_controlled, 
+                    source, 
                     after=lambda e: asyncio.run_coroutine_threadsafe(
                         self._track_finished(ctx), 
                         self.client.loop
@@ -183,19 +834,16 @@ class Music(commands.Cog):
                 ))
                 return
 
-            self.current_track = track
-            self.is_playing = True
+            player.current_track = track
+            player.queue.taken = None
+            player.is_playing = True
+            player.text_channel_id = ctx.channel.id
+            player.log({'op': 'play', 'track': track.to_dict(), 't': offset,
+                        'voice': ctx.voice_client.channel.id, 'text': ctx.channel.id})
+            player.prefetch_task = asyncio.create_task(self._prefetch(player, track))
+            await self._record_play(track)
 
-            embed = discord.Embed(
-                title="🎵 Now Playing", 
-                description=f"**{track.title}**\n"
-                            f"Artist: {track.artist or 'Unknown'}\n"
-                            f"Duration: {self.format_duration(track.duration)}\n"
-                            f"Requested by: {track.requester.mention}",
-                color=0x2ecc71
-            )
-            embed.set_thumbnail(url=track.thumbnail)
-            await ctx.send(embed=embed)
+            player.now_playing_message = await ctx.send(embed=self._now_playing_embed(track))
 
         except Exception as e:
             print(f"Unexpected error in _play_track: {e}")
@@ -206,36 +854,94 @@ class Music(commands.Cog):
             ))
             if ctx.voice_client:
                 await ctx.voice_client.disconnect()
-
+        finally:
+            player.starting = False
 
     async def _track_finished(self, ctx: commands.Context):
-        self.is_playing = False
+        player = self.get_player(ctx.guild)
+        player.is_playing = False
 
-        if self.is_loop and self.current_track:
-            await self._play_track(ctx, self.current_track)
+        if player.is_loop and player.current_track:
+            await self._play_track(ctx, player.current_track)
             return
 
-        next_track = self.queue.next()
+        next_track = player.queue.next()
         if next_track:
             await self._play_track(ctx, next_track)
         else:
             if ctx.voice_client:
                 await ctx.voice_client.disconnect()
-                self.current_track = None
+            player.end_session()
+
+    def _collect_metrics(self):
+        yield ("anybot_players", "gauge", "Guild players currently held in memory.", [({}, len(self.players))])
+        yield ("anybot_queue_depth", "gauge", "Tracks waiting in each guild's queue.",
+               [({'guild': guild_id}, len(player.queue)) for guild_id, player in self.players.items()])
+
+        caches = {'track': self.track_cache.get_stats(), 'search': self.search_engine.stats}
+        if self.lyrics:
+            caches['lyrics'] = self.lyrics.get_stats()
+        if self.audio_cache:
+            caches['audio'] = self.audio_cache.get_stats()
+        hits, misses, evictions, ratios = [], [], [], []
+        for cache, stats in caches.items():
+            cache_hits = stats.get('hits', stats.get('memory_hits', 0) + stats.get('disk_hits', 0))
+            hits.append(({'cache': cache}, cache_hits))
+            misses.append(({'cache': cache}, stats['misses']))
+            if 'evictions' in stats:
+                evictions.append(({'cache': cache}, stats['evictions']))
+            total = cache_hits + stats['misses']
+            ratios.append(({'cache': cache}, cache_hits / total if total else 0.0))
+        yield ("anybot_cache_hits_total", "counter", "Cache lookups answered from the cache.", hits)
+        yield ("anybot_cache_misses_total", "counter", "Cache lookups that missed.", misses)
+        yield ("anybot_cache_evictions_total", "counter", "Entries evicted from a cache.", evictions)
+        yield ("anybot_cache_hit_ratio", "gauge", "Share of cache lookups that hit.", ratios)
+
+    @commands.hybrid_command(name="cachestats")
+    @commands.is_owner()
+    async def cache_stats(self, ctx: commands.Context):
+        stats = self.track_cache.get_stats()
+        embed = discord.Embed(title="Track Cache", color=0x3498db)
+        embed.add_field(name="Memory Hits", value=str(stats['memory_hits']))
+        embed.add_field(name="Disk Hits", value=str(stats['disk_hits']))
+        embed.add_field(name="Misses", value=str(stats['misses']))
+        embed.add_field(name="Evictions", value=str(stats['evictions']))
+        embed.add_field(name="Stream Refreshes", value=str(stats['stream_refreshes']))
+        embed.add_field(name="Hit Rate", value=f"{stats['hit_rate']:.1%}")
+        embed.add_field(name="In Memory", value=f"{stats['memory_entries']}/{self.track_cache.memory_size}")
+        if self.audio_cache:
+            audio_stats = self.audio_cache.get_stats()
+            embed.add_field(
+                name="Audio Cache",
+                value=f"{audio_stats['files']} files, {audio_stats['bytes'] / 1024 ** 2:.0f}/"
+                      f"{audio_stats['max_bytes'] / 1024 ** 2:.0f} MB, {audio_stats['hits']} hits, "
+                      f"{audio_stats['misses']} misses, {audio_stats['evictions']} evictions",
+                inline=False
+            )
+        if self.lyrics:
+            lyrics_stats = self.lyrics.get_stats()
+            embed.add_field(
+                name="Lyrics",
+                value=f"{lyrics_stats['memory_hits']} memory / {lyrics_stats['disk_hits']} disk hits, "
+                      f"{lyrics_stats['misses']} misses, {lyrics_stats['coalesced']} coalesced",
+                inline=False
+            )
+        await ctx.send(embed=embed)
 
     @commands.hybrid_command(name="lyrics")
     async def get_lyrics(self, ctx: commands.Context, *, query: Optional[str] = None):
-        if not self.genius:
+        player = self.get_player(ctx.guild)
+        if not self.lyrics:
             return await ctx.send("Lyrics service is not available.")
 
         try:
-            if not query and self.current_track:
-                query = f"{self.current_track.title} {self.current_track.artist}"
-            
-            if not query:
+            if query:
+                song = await self.lyrics.search(query)
+            elif player.current_track:
+                query = player.current_track.title
+                song = await self.lyrics.search(player.current_track.title, player.current_track.artist)
+            else:
                 return await ctx.send("Please provide a song name or play a track first.")
-
-            song = self.genius.search_song(query)
             
             if not song:
                 return await ctx.send(f"No lyrics found for {query}")
@@ -257,9 +963,21 @@ class Music(commands.Cog):
         except Exception as e:
             await ctx.send(f"Error fetching lyrics: {str(e)}")
 
+    @staticmethod
+    def _write_playlist(path: str, playlist_data: Dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(playlist_data, f)
+
+    @staticmethod
+    def _read_playlist(path: str) -> Dict:
+        with open(path, "r") as f:
+            return json.load(f)
+
     @commands.hybrid_command(name="saveplaylist")
     async def save_playlist(self, ctx: commands.Context, name: str):
-        if not self.queue.get_queue():
+        player = self.get_player(ctx.guild)
+        if not player.queue:
             return await ctx.send("No tracks in the queue to save.")
 
         try:
@@ -269,20 +987,11 @@ class Music(commands.Cog):
                     {
                         'title': track.title,
                         'url': track.url
-                    } for track in self.queue.get_queue()
+                    } for track in player.queue
                 ]
             }
 
-            try:
-                with open(f"playlists/{ctx.author.id}_{name}.txt", "w") as f:
-                    import json
-                    json.dump(playlist_data, f)
-            except FileNotFoundError:
-                import os
-                os.makedirs("playlists", exist_ok=True)
-                with open(f"playlists/{ctx.author.id}_{name}.txt", "w") as f:
-                    import json
-                    json.dump(playlist_data, f)
+            await asyncio.to_thread(self._write_playlist, f"playlists/{ctx.author.id}_{name}.txt", playlist_data)
 
             await ctx.send(f"Playlist '{name}' saved successfully!")
 
@@ -291,47 +1000,76 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="loadplaylist")
     async def load_playlist(self, ctx: commands.Context, name: str):
+        player = self.get_player(ctx.guild)
         try:
-            with open(f"playlists/{ctx.author.id}_{name}.txt", "r") as f:
-                import json
-                playlist_data = json.load(f)
-
-            self.queue.clear()
-            for track_info in playlist_data['tracks']:
-                track = self._fetch_track_info(track_info['url'], ctx.author)
-                self.queue.add(track)
-
-            await ctx.send(f"Playlist '{name}' loaded successfully!")
-
-            if not self.is_playing:
-                next_track = self.queue.next()
-                await self._play_track(ctx, next_track)
-
+            playlist_data = await asyncio.to_thread(self._read_playlist, f"playlists/{ctx.author.id}_{name}.txt")
         except FileNotFoundError:
-            await ctx.send(f"Playlist '{name}' not found.")
+            return await ctx.send(f"Playlist '{name}' not found.")
+        except Exception as e:
+            return await ctx.send(f"Error loading playlist: {str(e)}")
+
+        tracks = playlist_data['tracks']
+        player.queue.clear()
+        status = await ctx.send(f"Loading playlist '{name}' (0/{len(tracks)})...")
+        semaphore = asyncio.Semaphore(self.playlist_concurrency)
+
+        async def resolve(track_info):
+            async with semaphore:
+                return await self._fetch_track_info(track_info['url'], ctx.author)
+
+        # Resolve concurrently but consume in playlist order, so the first
+        # track starts playing while the rest are still being fetched.
+        pending = [asyncio.create_task(resolve(track_info)) for track_info in tracks]
+        loaded = skipped = 0
+        last_update = asyncio.get_running_loop().time()
+        try:
+            for i, task in enumerate(pending, 1):
+                try:
+                    track = await task
+                except ValueError:
+                    skipped += 1
+                else:
+                    loaded += 1
+                    if not player.busy:
+                        await self._play_track(ctx, track)
+                    else:
+                        player.queue.add(track)
+
+                now = asyncio.get_running_loop().time()
+                if now - last_update >= 2 and i < len(pending):
+                    last_update = now
+                    await status.edit(content=f"Loading playlist '{name}' ({i}/{len(pending)})...")
+
+            summary = f"Playlist '{name}' loaded successfully! ({loaded} tracks"
+            summary += f", {skipped} skipped)" if skipped else ")"
+            await status.edit(content=summary)
         except Exception as e:
             await ctx.send(f"Error loading playlist: {str(e)}")
+        finally:
+            for task in pending:
+                task.cancel()
 
     @commands.hybrid_command(name="search")
     async def advanced_search(self, ctx: commands.Context, *, query: str):
         try:
-            with yt_dlp.YoutubeDL(self.YDL_OPTIONS) as ydl:
-                search_results = ydl.extract_info(f"ytsearch5:{query}", download=False)['entries']
+            search_results = await self.search_engine.search(query)
+            if not search_results:
+                return await ctx.send(f"No results found for '{query}'")
 
             search_pages = []
             for i, result in enumerate(search_results, 1):
                 embed = discord.Embed(
                     title=f"Search Results for '{query}'",
                     description=f"{i}. **{result['title']}**\n"
-                                f"Channel: {result.get('uploader', 'Unknown')}\n"
+                                f"Channel: {result['uploader'] or 'Unknown'}\n"
                                 f"Duration: {self.format_duration(result.get('duration'))}\n"
                                 f"[Watch on YouTube]({result['webpage_url']})",
                     color=0x3498db
                 )
-                embed.set_thumbnail(url=result.get('thumbnail'))
+                embed.set_thumbnail(url=result['thumbnail'])
                 search_pages.append(embed)
 
-            paginator = pages.Paginator(pages=search_pages)
+            paginator = pages.Paginator(pages=search_pages, custom_view=SearchPicker(self, ctx, search_results))
             await paginator.send(ctx)
 
         except Exception as e:
@@ -348,6 +1086,7 @@ class Music(commands.Cog):
     @commands.command(name="disconnect", aliases=["leave"])
     async def disconnect(self, ctx: commands.Context):
         if ctx.voice_client:
+            self.get_player(ctx.guild).end_session()
             await ctx.voice_client.disconnect()
             await ctx.send("Disconnected from voice channel.")
         else:
@@ -355,6 +1094,8 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="play")
     async def play(self, ctx: commands.Context, *, query: str):
+        requested_at = time.perf_counter()
+        player = self.get_player(ctx.guild)
         await ctx.defer()
 
         if not ctx.author.voice:
@@ -365,18 +1106,8 @@ class Music(commands.Cog):
             ))
 
         try:
-            track = self._fetch_track_info(query, ctx.author)
-
-            if self.is_playing:
-                self.queue.add(track)
-                await ctx.send(embed=discord.Embed(
-                    title="Added to Queue", 
-                    description=f"**{track.title}** has been added to the playlist.", 
-                    color=0x3498db
-                ))
-            else:
-                await self._play_track(ctx, track)
-
+            track = await self._fetch_track_info(query, ctx.author)
+            await self._enqueue(ctx, track, requested_at)
         except ValueError as ve:
             await ctx.send(embed=discord.Embed(
                 title="Track Error", 
@@ -384,9 +1115,39 @@ class Music(commands.Cog):
                 color=0xe74c3c
             ))
 
+    async def _enqueue(self, ctx: commands.Context, track: TrackInfo, requested_at: Optional[float] = None):
+        player = self.get_player(ctx.guild)
+        if player.busy:
+            player.queue.add(track)
+            await ctx.send(embed=discord.Embed(
+                title="Added to Queue", 
+                description=f"**{track.title}** has been added to the playlist.", 
+                color=0x3498db
+            ))
+        else:
+            await self._play_track(ctx, track, requested_at)
+
+    async def _play_search_result(self, ctx: commands.Context, result: Dict):
+        if not ctx.author.voice:
+            return await ctx.send(embed=discord.Embed(
+                title="Connection Required", 
+                description="Please join a voice channel first.", 
+                color=0xe74c3c
+            ))
+
+        # Reuse the metadata the search already returned; the stream URL is
+        # resolved just in time by _play_track.
+        entry = await self.track_cache.get_by_id(result['id']) if result['id'] else None
+        if entry is None:
+            entry = await self.track_cache.put(None, dict(result, artist=self._artist_from(result)))
+        track = TrackInfo(dict(entry, requester=ctx.author))
+        self._enrich(track)
+        await self._enqueue(ctx, track)
+
     @commands.hybrid_command(name="queue")
     async def show_queue(self, ctx: commands.Context):
-        queue_list = self.queue.get_queue()
+        player = self.get_player(ctx.guild)
+        queue_list = player.queue.get_queue()
         
         if not queue_list:
             return await ctx.send(embed=discord.Embed(
@@ -401,7 +1162,7 @@ class Music(commands.Cog):
             for j, track in enumerate(queue_list[i:i+5], start=i+1):
                 embed.add_field(
                     name=f"{j}. {track.title}", 
-                    value=f"Duration: {self.format_duration(track.duration)} | Requested by: {track.requester.mention}", 
+                    value=f"Duration: {self.format_duration(track.duration)} | Requested by: {track.requester_mention}", 
                     inline=False
                 )
             queue_pages.append(embed)
@@ -411,14 +1172,15 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="skip")
     async def skip(self, ctx: commands.Context):
-        if not ctx.voice_client or not self.is_playing:
+        player = self.get_player(ctx.guild)
+        if not ctx.voice_client or not player.is_playing:
             return await ctx.send(embed=discord.Embed(
                 title="Skip Failed", 
                 description="No track is currently playing.", 
                 color=0xe74c3c
             ))
 
-        skipped_track = self.current_track
+        skipped_track = player.current_track
         ctx.voice_client.stop()
 
         await ctx.send(embed=discord.Embed(
@@ -427,27 +1189,26 @@ class Music(commands.Cog):
             color=0xf39c12
         ))
 
-        if self.queue.get_queue():
-            next_track = self.queue.next()
-            await self._play_track(ctx, next_track)
-
     @commands.hybrid_command(name="loop")
     async def toggle_loop(self, ctx: commands.Context):
-        self.is_loop = not self.is_loop
-        
+        player = self.get_player(ctx.guild)
+        player.is_loop = not player.is_loop
+        player.log({'op': 'loop', 'loop': player.is_loop})
+
         await ctx.send(embed=discord.Embed(
             title="Loop Status", 
-            description=f"Looping is now {'enabled' if self.is_loop else 'disabled'}.", 
+            description=f"Looping is now {'enabled' if player.is_loop else 'disabled'}.", 
             color=0x2ecc71
         ))
     
     @commands.hybrid_command(name="pause")
     async def pause(self, ctx: commands.Context):
+        player = self.get_player(ctx.guild)
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
             await ctx.send(embed=discord.Embed(
                 title="Playback Paused",
-                description=f"**{self.current_track.title}** paused",
+                description=f"**{player.current_track.title}** paused",
                 color=0xf39c12
             ))
         else:
@@ -459,11 +1220,12 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="resume")
     async def resume(self, ctx: commands.Context):
+        player = self.get_player(ctx.guild)
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
             await ctx.send(embed=discord.Embed(
                 title="Playback Resumed",
-                description=f"**{self.current_track.title}** resumed",
+                description=f"**{player.current_track.title}** resumed",
                 color=0x2ecc71
             ))
         else:
@@ -475,11 +1237,20 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="volume")
     async def set_volume(self, ctx: commands.Context, volume: int):
+        player = self.get_player(ctx.guild)
         if 0 <= volume <= 200:
-            self.volume = volume / 100
+            player.volume = volume / 100
+            player.log({'op': 'volume', 'volume': player.volume})
             
-            if ctx.voice_client and ctx.voice_client.source and isinstance(ctx.voice_client.source, discord.PCMVolumeTransformer):
-                ctx.voice_client.source.volume = self.volume
+            if ctx.voice_client and isinstance(ctx.voice_client.source, PlaybackSource) and player.current_track:
+                try:
+                    await self._apply_volume(ctx.voice_client, player, ctx.voice_client.source)
+                except Exception as e:
+                    return await ctx.send(embed=discord.Embed(
+                        title="Volume Changed",
+                        description=f"Volume set to {volume}% (will apply to next track): {str(e)}",
+                        color=0xf39c12
+                    ))
                 
                 await ctx.send(embed=discord.Embed(
                     title="Volume Changed",
@@ -501,8 +1272,9 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="shuffle")
     async def shuffle_queue(self, ctx: commands.Context):
-        if len(self.queue) > 1:
-            self.queue.shuffle()
+        player = self.get_player(ctx.guild)
+        if len(player.queue) > 1:
+            player.queue.shuffle()
             await ctx.send(embed=discord.Embed(
                 title="Queue Shuffled",
                 description="Playlist order randomized",
@@ -517,17 +1289,9 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="nowplaying", aliases=["np"])
     async def now_playing(self, ctx: commands.Context):
-        if self.current_track:
-            embed = discord.Embed(
-                title="🎶 Now Playing",
-                description=f"**{self.current_track.title}**\n"
-                            f"Artist: {self.current_track.artist or 'Unknown'}\n"
-                            f"Duration: {self.format_duration(self.current_track.duration)}\n"
-                            f"Requested by: {self.current_track.requester.mention}",
-                color=0x2ecc71
-            )
-            embed.set_thumbnail(url=self.current_track.thumbnail)
-            await ctx.send(embed=embed)
+        player = self.get_player(ctx.guild)
+        if player.current_track:
+            await ctx.send(embed=self._now_playing_embed(player.current_track, title="🎶 Now Playing"))
         else:
             await ctx.send(embed=discord.Embed(
                 title="Now Playing",
@@ -537,8 +1301,9 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="remove")
     async def remove_track(self, ctx: commands.Context, position: int):
-        if 1 <= position <= len(self.queue):
-            removed = self.queue._queue.pop(position-1)
+        player = self.get_player(ctx.guild)
+        if 1 <= position <= len(player.queue):
+            removed = player.queue.remove(position-1)
             await ctx.send(embed=discord.Embed(
                 title="Track Removed",
                 description=f"Removed **{removed.title}** from position {position}",
@@ -551,9 +1316,27 @@ class Music(commands.Cog):
                 color=0xe74c3c
             ))
 
+    @commands.hybrid_command(name="move")
+    async def move_track(self, ctx: commands.Context, position: int, new_position: int):
+        player = self.get_player(ctx.guild)
+        if 1 <= position <= len(player.queue) and 1 <= new_position <= len(player.queue):
+            moved = player.queue.move(position-1, new_position-1)
+            await ctx.send(embed=discord.Embed(
+                title="Track Moved",
+                description=f"Moved **{moved.title}** to position {new_position}",
+                color=0x2ecc71
+            ))
+        else:
+            await ctx.send(embed=discord.Embed(
+                title="Invalid Position",
+                description="Please provide valid queue positions",
+                color=0xe74c3c
+            ))
+
     @commands.hybrid_command(name="clear")
     async def clear_queue(self, ctx: commands.Context):
-        self.queue.clear()
+        player = self.get_player(ctx.guild)
+        player.queue.clear()
         await ctx.send(embed=discord.Embed(
             title="Queue Cleared",
             description="All tracks removed from playlist",
@@ -562,7 +1345,9 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name="history")
     async def show_history(self, ctx: commands.Context):
-        if not self.queue._history:
+        player = self.get_player(ctx.guild)
+        history = player.queue.get_history()
+        if not history:
             return await ctx.send(embed=discord.Embed(
                 title="Play History",
                 description="No tracks in history",
@@ -570,12 +1355,12 @@ class Music(commands.Cog):
             ))
 
         history_pages = []
-        for i in range(0, len(self.queue._history), 5):
+        for i in range(0, len(history), 5):
             embed = discord.Embed(title="⏪ Play History", color=0x3498db)
-            for j, track in enumerate(self.queue._history[i:i+5], start=i+1):
+            for j, track in enumerate(history[i:i+5], start=i+1):
                 embed.add_field(
                     name=f"{j}. {track.title}",
-                    value=f"Duration: {self.format_duration(track.duration)} | Requested by: {track.requester.mention}",
+                    value=f"Duration: {self.format_duration(track.duration)} | Requested by: {track.requester_mention}",
                     inline=False
                 )
             history_pages.append(embed)
@@ -605,11 +1390,10 @@ class Music(commands.Cog):
         
     @commands.hybrid_command(name="stop")
     async def stop(self, ctx: commands.Context):
+        player = self.get_player(ctx.guild)
         if ctx.voice_client:
+            player.reset()
             ctx.voice_client.stop()
-            self.queue.clear()
-            self.current_track = None
-            self.is_playing = False
             await ctx.voice_client.disconnect()
         
             await ctx.send(embed=discord.Embed(
@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+import discord
+
+from rate_limit import TokenBucket
+
+Check = Callable[[discord.Message], bool]
+Progress = Callable[[int, int], Awaitable]
+
+# Discord refuses to bulk delete messages older than 14 days. The margin keeps
+# a message from crossing the line between being streamed and being deleted.
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+BULK_DELETE_SIZE = 100
+
+
+class PurgeResult(NamedTuple):
+    scanned: int
+    deleted: int
+    failed: int
+    cancelled: bool
+
+
+async def run_purge(channel: discord.abc.Messageable, limit: int, check: Optional[Check] = None,
+                    before: Optional[discord.abc.Snowflake] = None, after: Optional[datetime.datetime] = None,
+                    concurrency: int = 5, bucket: Optional[TokenBucket] = None, progress: Optional[Progress] = None,
+                    progress_interval: float = 2.0, cancel: Optional[asyncio.Event] = None) -> PurgeResult:
+    # Streams `limit` messages of history once. Recent matches are deleted in
+    # chunks of 100 while the next page is fetched; older matches go to a pool
+    # of `concurrency` workers paced by the bucket. The queue between them is
+    # bounded, so memory stays flat however far back the purge reaches.
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    scanned = deleted = failed = 0
+    chunk: List[discord.Message] = []
+    bulk_task: Optional[asyncio.Task] = None
+    old_messages: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    last_update = time.monotonic()
+
+    async def bulk_delete(messages: List[discord.Message]):
+        nonlocal deleted, failed
+        try:
+            if len(messages) == 1:
+                await messages[0].delete()
+            else:
+                await channel.delete_messages(messages)
+            deleted += len(messages)
+        except discord.NotFound:
+            pass
+        except discord.HTTPException:
+            failed += len(messages)
+
+    async def delete_old():
+        nonlocal deleted, failed
+        while True:
+            message = await old_messages.get()
+            if message is None:
+                return
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                await message.delete()
+                deleted += 1
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                failed += 1
+
+    async def flush_chunk():
+        nonlocal bulk_task, chunk
+        # One bulk delete in flight at a time; it overlaps the next history page.
+        if bulk_task is not None:
+            await bulk_task
+        bulk_task = asyncio.create_task(bulk_delete(chunk)) if chunk else None
+        chunk = []
+
+    stopped = False
+    workers = [asyncio.create_task(delete_old()) for _ in range(concurrency)]
+    try:
+        async for message in channel.history(limit=limit, before=before, after=after, oldest_first=False):
+            if cancel is not None and cancel.is_set():
+                stopped = True
+                break
+            scanned += 1
+            if check is None or check(message):
+                if message.created_at > cutoff:
+                    chunk.append(message)
+                    if len(chunk) >= BULK_DELETE_SIZE:
+                        await flush_chunk()
+                else:
+                    # History runs newest first, so nothing after this is recent.
+                    if chunk:
+                        await flush_chunk()
+                    await old_messages.put(message)
+
+            now = time.monotonic()
+            if progress is not None and now - last_update >= progress_interval:
+                last_update = now
+                try:
+                    await progress(scanned, deleted)
+                except discord.HTTPException:
+                    pass
+
+        if stopped:
+            # Requests already in flight finish; nothing new is started.
+            chunk.clear()
+            while not old_messages.empty():
+                old_messages.get_nowait()
+        await flush_chunk()
+        if bulk_task is not None:
+            await bulk_task
+        for _ in workers:
+            await old_messages.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        if bulk_task is not None:
+            bulk_task.cancel()
+
+    return PurgeResult(scanned, deleted, failed, stopped)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+Snapshot = Callable[[int], Optional[Dict]]
+
+
+def replay(lines: List[str]) -> Dict:
+    # Folds a guild's journal into the session it describes. A torn last line
+    # from a crash mid-write ends the replay at the last complete entry.
+    session = {'current': None, 't': 0.0, 'queue': deque(), 'voice': None, 'text': None,
+               'volume': 1.0, 'loop': False, 'taken': None}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break
+        try:
+            _apply(session, entry)
+        except (KeyError, IndexError):
+            continue
+    # A track taken off the queue whose 'play' never made it to the journal
+    # was about to start when the bot stopped.
+    taken = session.pop('taken')
+    if taken is not None:
+        session.update(current=taken, t=0.0)
+    session['queue'] = list(session['queue'])
+    return session
+
+
+def _apply(session: Dict, entry: Dict):
+    op = entry['op']
+    queue = session['queue']
+    if op == 'snapshot':
+        session.update(entry, queue=deque(entry['queue']), taken=None)
+        del session['op']
+    elif op == 'add':
+        queue.append(entry['track'])
+    elif op == 'add_next':
+        queue.appendleft(entry['track'])
+    elif op == 'next':
+        if queue:
+            session['taken'] = queue.popleft()
+    elif op == 'remove':
+        del queue[entry['index']]
+    elif op == 'move':
+        track = queue[entry['from']]
+        del queue[entry['from']]
+        queue.insert(entry['to'], track)
+    elif op == 'clear':
+        queue.clear()
+    elif op == 'play':
+        session.update(current=entry['track'], t=entry.get('t', 0.0), voice=entry['voice'], text=entry['text'],
+                       taken=None)
+    elif op == 'pos':
+        session['t'] = entry['t']
+    elif op == 'volume':
+        session['volume'] = entry['volume']
+    elif op == 'loop':
+        session['loop'] = entry['loop']
+
+
+class QueueJournal:
+    # One append-only file of JSON lines per guild. Entries are buffered and
+    # appended in batches; a guild's file is rewritten as a single snapshot
+    # only when its log has grown well past the size of the queue itself, or
+    # after a shuffle, which can't be replayed from the operation alone.
+    def __init__(self, directory: str = "data/queues", snapshot: Optional[Snapshot] = None,
+                 compact_after: int = 500, flush_interval: float = 0.5):
+        self.directory = directory
+        self.snapshot = snapshot
+        self.compact_after = compact_after
+        self.flush_interval = flush_interval
+
+        # guild id -> (mode, lines): 'a' appends, 'w' replaces the file and
+        # 'd' deletes it.
+        self._pending: Dict[int, Tuple[str, List[str]]] = {}
+        self._entries: Dict[int, int] = {}
+        self._snapshot_sizes: Dict[int, int] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._writer: Optional[asyncio.Task] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, guild_id: int) -> str:
+        return os.path.join(self.directory, f"{guild_id}.jsonl")
+
+    def _load(self) -> Dict[int, Dict]:
+        sessions = {}
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext != ".jsonl" or not stem.isdigit():
+                continue
+            with open(os.path.join(self.directory, name)) as f:
+                lines = f.readlines()
+            guild_id = int(stem)
+            sessions[guild_id] = replay(lines)
+            self._entries[guild_id] = len(lines)
+            self._snapshot_sizes[guild_id] = len(sessions[guild_id]['queue'])
+        return sessions
+
+    async def load(self) -> Dict[int, Dict]:
+        return await asyncio.to_thread(self._load)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._run())
+
+    def record(self, guild_id: int, entry: Dict):
+        op = entry['op']
+        if op == 'end':
+            self._pending[guild_id] = ('d', [])
+            self._entries.pop(guild_id, None)
+            self._snapshot_sizes.pop(guild_id, None)
+            self._wake.set()
+            return
+
+        entries = self._entries.get(guild_id, 0) + 1
+        if op == 'shuffle' or entries > self.compact_after + self._snapshot_sizes.get(guild_id, 0):
+            if self._compact(guild_id):
+                return
+        if op == 'shuffle':
+            return
+
+        self._entries[guild_id] = entries
+        line = json.dumps(entry, separators=(',', ':'))
+        mode, lines = self._pending.get(guild_id, ('a', []))
+        lines.append(line)
+        # Writing after a delete starts a new file.
+        self._pending[guild_id] = ('w' if mode == 'd' else mode, lines)
+        self._wake.set()
+
+    def _compact(self, guild_id: int) -> bool:
+        snapshot = self.snapshot(guild_id) if self.snapshot else None
+        if snapshot is None:
+            return False
+        self._pending[guild_id] = ('w', [json.dumps(dict(snapshot, op='snapshot'), separators=(',', ':'))])
+        self._entries[guild_id] = 1
+        self._snapshot_sizes[guild_id] = len(snapshot['queue'])
+        self._wake.set()
+        return True
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+            try:
+                await self.flush()
+            except OSError as e:
+                print(f"Writing the queue journal failed: {e}")
+
+    def _write(self, batch: Dict[int, Tuple[str, List[str]]]):
+        for guild_id, (mode, lines) in batch.items():
+            path = self._path(guild_id)
+            if mode == 'd':
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            elif mode == 'w':
+                # Snapshots replace the file in one step, so a crash leaves
+                # either the old log or the new snapshot.
+                with open(f"{path}.tmp", "w") as f:
+                    f.write("\n".join(lines) + "\n")
+                os.replace(f"{path}.tmp", path)
+            else:
+                with open(path, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except BaseException:
+                # Some appends may be lost, so the next write for these guilds
+                # is a full snapshot instead.
+                for guild_id, (mode, _) in batch.items():
+                    if mode == 'd':
+                        self._pending.setdefault(guild_id, ('d', []))
+                    else:
+                        self._compact(guild_id)
+                raise
+
+    def close(self):
+        # Called from cog_unload, which is synchronous.
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+        batch, self._pending = self._pending, {}
+        self._write(batch)
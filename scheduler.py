@@ -0,0 +1,215 @@
+import asyncio
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import discord
+
+from rate_limit import TokenBucket
+
+# Long sleeps are cut short now and then so a wall clock jump (suspend,
+# NTP step) delays an action by at most this much.
+MAX_SLEEP = 300.0
+RETRY_DELAY = 60.0
+
+
+class ScheduledAction(NamedTuple):
+    action_id: int
+    guild_id: int
+    member_id: int
+    action: str
+    due: float
+    until: Optional[float]
+    reason: Optional[str]
+
+
+# Returns a new due time to run the action again, or None when it is done.
+Handler = Callable[[ScheduledAction], Awaitable[Optional[float]]]
+
+
+class Scheduler:
+    # Pending actions live in SQLite; memory only holds a heap of
+    # (due, action_id) pairs. Cancelling deletes the row and leaves the heap
+    # entry behind, which is skipped when it comes due.
+    def __init__(self, handler: Handler, path: str = "data/schedule.db", batch_size: int = 100,
+                 concurrency: int = 5, rate: float = 10.0):
+        self.handler = handler
+        self.path = path
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, 1.0)
+
+        self._heap: List[Tuple[float, int]] = []
+        self._wake = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS scheduled_actions (
+                action_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                member_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                due REAL NOT NULL,
+                until REAL,
+                reason TEXT
+            );
+            CREATE INDEX IF NOT EXISTS scheduled_actions_member ON scheduled_actions (guild_id, member_id, action);
+        """)
+        self._db.commit()
+
+    def _load(self) -> List[Tuple[float, int]]:
+        with self._lock:
+            return self._db.execute("SELECT due, action_id FROM scheduled_actions").fetchall()
+
+    async def start(self):
+        self._heap = await asyncio.to_thread(self._load)
+        heapq.heapify(self._heap)
+        self._runner = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _insert(self, rows: List[Tuple], replace: bool) -> List[Tuple[float, int]]:
+        with self._lock:
+            if replace:
+                self._db.executemany(
+                    "DELETE FROM scheduled_actions WHERE guild_id = ? AND member_id = ? AND action = ?",
+                    [row[:3] for row in rows]
+                )
+            entries = []
+            for row in rows:
+                cursor = self._db.execute(
+                    "INSERT INTO scheduled_actions (guild_id, member_id, action, due, until, reason) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", row
+                )
+                entries.append((row[3], cursor.lastrowid))
+            self._db.commit()
+        return entries
+
+    async def schedule_many(self, actions: Iterable[Tuple[int, int, str, float, Optional[float], Optional[str]]],
+                            replace: bool = False):
+        # Each action is (guild_id, member_id, action, due, until, reason).
+        # With `replace`, pending actions of the same kind for the same
+        # members are cancelled in the same transaction.
+        rows = list(actions)
+        if not rows:
+            return
+        entries = await asyncio.to_thread(self._insert, rows, replace)
+        earliest = self._heap[0][0] if self._heap else None
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+        if earliest is None or self._heap[0][0] < earliest:
+            self._wake.set()
+
+    async def schedule(self, guild_id: int, member_id: int, action: str, due: float,
+                       until: Optional[float] = None, reason: Optional[str] = None, replace: bool = False):
+        await self.schedule_many([(guild_id, member_id, action, due, until, reason)], replace)
+
+    def _delete(self, guild_id: int, member_id: int, action: str) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM scheduled_actions WHERE guild_id = ? AND member_id = ? AND action = ?",
+                (guild_id, member_id, action)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    async def cancel(self, guild_id: int, member_id: int, action: str) -> int:
+        return await asyncio.to_thread(self._delete, guild_id, member_id, action)
+
+    def _fetch(self, action_ids: List[int]) -> List[ScheduledAction]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM scheduled_actions WHERE action_id IN ({', '.join('?' for _ in action_ids)})",
+                action_ids
+            ).fetchall()
+        return [ScheduledAction(*row) for row in rows]
+
+    def _finish(self, done: List[int], rescheduled: List[Tuple[float, int]]):
+        with self._lock:
+            self._db.executemany("DELETE FROM scheduled_actions WHERE action_id = ?", [(i,) for i in done])
+            self._db.executemany("UPDATE scheduled_actions SET due = ? WHERE action_id = ?", rescheduled)
+            self._db.commit()
+
+    async def _run(self):
+        # wait_for can swallow a cancellation that lands just as the wake
+        # event is set, so the loop also stops on the closed flag.
+        while not self._closed:
+            if not self._heap:
+                await self._wake.wait()
+                self._wake.clear()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                # Sleeps until the earliest action, or until an earlier one is
+                # scheduled.
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+
+            now = time.time()
+            due: List[int] = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                due.append(heapq.heappop(self._heap)[1])
+            try:
+                await self._run_batch(due)
+            except sqlite3.Error as e:
+                print(f"Running scheduled actions failed: {e}")
+                for action_id in due:
+                    heapq.heappush(self._heap, (now + RETRY_DELAY, action_id))
+
+    async def _run_batch(self, action_ids: List[int]):
+        # Cancelled actions have no row any more and drop out here.
+        actions = await asyncio.to_thread(self._fetch, action_ids)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done: List[int] = []
+        rescheduled: List[Tuple[float, int]] = []
+
+        async def run(action: ScheduledAction):
+            async with semaphore:
+                await self.bucket.acquire()
+                try:
+                    next_due = await self.handler(action)
+                except (discord.NotFound, discord.Forbidden) as e:
+                    print(f"Dropping scheduled {action.action} for {action.member_id}: {e}")
+                    next_due = None
+                except discord.HTTPException as e:
+                    print(f"Scheduled {action.action} for {action.member_id} failed, retrying: {e}")
+                    next_due = time.time() + RETRY_DELAY
+                except Exception as e:
+                    print(f"Scheduled {action.action} for {action.member_id} failed: {e}")
+                    next_due = None
+            if next_due is None:
+                done.append(action.action_id)
+            else:
+                rescheduled.append((next_due, action.action_id))
+
+        await asyncio.gather(*(run(action) for action in actions))
+        await asyncio.to_thread(self._finish, done, rescheduled)
+        for entry in rescheduled:
+            heapq.heappush(self._heap, entry)
+
+    async def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,203 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_ID_RE = re.compile(r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/)|youtu\.be/)([A-Za-z0-9_-]{11})")
+
+# Fields that stay valid for as long as the video exists.
+METADATA_FIELDS = ('id', 'title', 'duration', 'thumbnail', 'artist', 'webpage_url', 'loudness')
+
+
+class TrackCache:
+    def __init__(self, path: str = "cache/tracks.db", memory_size: int = 512,
+                 metadata_ttl: float = 30 * 86400, stream_ttl: float = 4 * 3600):
+        self.path = path
+        self.memory_size = memory_size
+        self.metadata_ttl = metadata_ttl
+        self.stream_ttl = stream_ttl
+
+        self._tracks: OrderedDict = OrderedDict()
+        self._queries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'stream_refreshes': 0,
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id TEXT PRIMARY KEY,
+                title TEXT,
+                duration INTEGER,
+                thumbnail TEXT,
+                artist TEXT,
+                webpage_url TEXT,
+                stream_url TEXT,
+                stream_expires REAL,
+                updated_at REAL,
+                loudness REAL
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                track_id TEXT NOT NULL,
+                created_at REAL
+            );
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tracks)")}
+        if 'loudness' not in columns:
+            self._db.execute("ALTER TABLE tracks ADD COLUMN loudness REAL")
+        self._db.commit()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        match = YOUTUBE_ID_RE.search(query)
+        if match:
+            return f"id:{match.group(1)}"
+        return " ".join(query.lower().split())
+
+    def stream_expiry(self, stream_url: Optional[str]) -> float:
+        now = time.time()
+        if not stream_url:
+            return now
+        # Signed googlevideo URLs carry their own expiry; keep a safety margin.
+        expire = parse_qs(urlparse(stream_url).query).get('expire')
+        if expire and expire[0].isdigit():
+            return min(float(expire[0]) - 300, now + self.stream_ttl)
+        return now + self.stream_ttl
+
+    @staticmethod
+    def stream_fresh(entry: Dict, margin: float = 0) -> bool:
+        return bool(entry.get('url')) and entry.get('stream_expires', 0) > time.time() + margin
+
+    def _remember(self, key: Optional[str], entry: Dict):
+        self._tracks[entry['id']] = entry
+        self._tracks.move_to_end(entry['id'])
+        if key and not key.startswith("id:"):
+            self._queries[key] = entry['id']
+            self._queries.move_to_end(key)
+
+        while len(self._tracks) > self.memory_size:
+            self._tracks.popitem(last=False)
+            self.stats['evictions'] += 1
+        while len(self._queries) > self.memory_size * 2:
+            self._queries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key.startswith("id:"):
+                track_id = key[3:]
+            else:
+                row = self._db.execute("SELECT track_id FROM queries WHERE query = ?", (key,)).fetchone()
+                if not row:
+                    return None
+                track_id = row[0]
+
+            row = self._db.execute(
+                "SELECT id, title, duration, thumbnail, artist, webpage_url, loudness, stream_url, stream_expires, updated_at "
+                "FROM tracks WHERE id = ?", (track_id,)
+            ).fetchone()
+
+        if not row or row[9] < time.time() - self.metadata_ttl:
+            return None
+        entry = dict(zip(METADATA_FIELDS, row[:7]))
+        entry['url'] = row[7]
+        entry['stream_expires'] = row[8] or 0
+        return entry
+
+    def _store(self, key: Optional[str], entry: Dict):
+        now = time.time()
+        with self._lock:
+            # A measured loudness survives re-resolution of the same video.
+            self._db.execute(
+                "INSERT INTO tracks (id, title, duration, thumbnail, artist, webpage_url, loudness, "
+                "stream_url, stream_expires, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title = excluded.title, duration = excluded.duration, "
+                "thumbnail = excluded.thumbnail, artist = excluded.artist, webpage_url = excluded.webpage_url, "
+                "loudness = COALESCE(excluded.loudness, tracks.loudness), stream_url = excluded.stream_url, "
+                "stream_expires = excluded.stream_expires, updated_at = excluded.updated_at",
+                tuple(entry.get(field) for field in METADATA_FIELDS) + (entry.get('url'), entry.get('stream_expires'), now)
+            )
+            if key and not key.startswith("id:"):
+                self._db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?)", (key, entry['id'], now))
+            self._db.commit()
+
+    def _prune(self):
+        with self._lock:
+            cutoff = time.time() - self.metadata_ttl
+            self._db.execute("DELETE FROM tracks WHERE updated_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM queries WHERE track_id NOT IN (SELECT id FROM tracks)")
+            self._db.commit()
+
+    async def get(self, query: str) -> Optional[Dict]:
+        return await self._get(self.normalize_query(query))
+
+    async def get_by_id(self, track_id: str) -> Optional[Dict]:
+        return await self._get(f"id:{track_id}")
+
+    async def _get(self, key: str) -> Optional[Dict]:
+        track_id = key[3:] if key.startswith("id:") else self._queries.get(key)
+        if track_id in self._tracks:
+            self._tracks.move_to_end(track_id)
+            self.stats['memory_hits'] += 1
+            return dict(self._tracks[track_id])
+
+        entry = await asyncio.to_thread(self._load, key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['disk_hits'] += 1
+        self._remember(key, entry)
+        return dict(entry)
+
+    async def put(self, query: Optional[str], info: Dict) -> Dict:
+        entry = {field: info.get(field) for field in METADATA_FIELDS}
+        entry['url'] = info.get('url')
+        entry['stream_expires'] = info.get('stream_expires') or self.stream_expiry(entry['url'])
+        if not entry['id']:
+            return entry
+        previous = self._tracks.get(entry['id'])
+        if entry['loudness'] is None and previous is not None:
+            entry['loudness'] = previous.get('loudness')
+
+        key = self.normalize_query(query) if query else None
+        self._remember(key, entry)
+        await asyncio.to_thread(self._store, key, entry)
+        return dict(entry)
+
+    async def update_stream(self, entry: Dict, stream_url: Optional[str]) -> Dict:
+        self.stats['stream_refreshes'] += 1
+        entry = dict(entry, url=stream_url, stream_expires=None)
+        return await self.put(None, entry)
+
+    async def set_loudness(self, track_id: str, loudness: float):
+        entry = await self.get_by_id(track_id)
+        if entry is not None:
+            await self.put(None, dict(entry, loudness=loudness))
+
+    async def prune(self):
+        await asyncio.to_thread(self._prune)
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return dict(
+            self.stats,
+            hit_rate=hits / lookups if lookups else 0.0,
+            memory_entries=len(self._tracks),
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
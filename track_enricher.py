@@ -0,0 +1,73 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from lyrics_service import LyricsService
+
+
+class TrackEnricher:
+    def __init__(self, lyrics: LyricsService, on_enriched: Callable[[str, str], Awaitable[None]],
+                 concurrency: int = 2, memory_size: int = 2048):
+        self.lyrics = lyrics
+        self.on_enriched = on_enriched
+        self.memory_size = memory_size
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Dict[str, List] = {}
+        self._done: OrderedDict = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    def close(self):
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for task in self._tasks:
+            task.cancel()
+
+    def submit(self, track):
+        if not track.id or track.id in self._done:
+            return
+        # Tracks with the same id (e.g. queued in several guilds) share a lookup.
+        if track.id in self._pending:
+            self._pending[track.id].append(track)
+            return
+        self._pending[track.id] = [track]
+        self._queue.put_nowait(track.id)
+
+    async def _run(self):
+        # Genius has no batch lookup, so each id is its own search; the
+        # semaphore in _enrich caps how many run at once.
+        while True:
+            track_id = await self._queue.get()
+            task = asyncio.create_task(self._enrich(track_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _enrich(self, track_id: str):
+        async with self._semaphore:
+            tracks = self._pending.get(track_id)
+            if not tracks:
+                return
+            try:
+                result = await self.lyrics.search(tracks[0].title)
+            except Exception as e:
+                print(f"Artist enrichment failed for {tracks[0].title}: {e}")
+                return
+            finally:
+                self._pending.pop(track_id, None)
+
+        self._done[track_id] = True
+        while len(self._done) > self.memory_size:
+            self._done.popitem(last=False)
+
+        if result is None or not result.artist:
+            return
+        for track in tracks:
+            track.artist = result.artist
+        await self.on_enriched(track_id, result.artist)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from metrics import EXTRACTION_SECONDS
+
+_worker = threading.local()
+
+
+def _init_worker(options: Dict):
+    # yt_dlp takes a noticeable time to import, so the first worker pays for
+    # it on its own thread instead of the bot paying for it at startup.
+    import yt_dlp
+    _worker.YoutubeDL = yt_dlp.YoutubeDL
+    _worker.options = options
+    _worker.ydl = yt_dlp.YoutubeDL(options)
+    _worker.flat_ydl = None
+
+
+def _extract(query: str, flat: bool = False) -> Dict:
+    # Each worker keeps its YoutubeDL instances for its whole lifetime;
+    # YoutubeDL is not thread-safe, so instances are never shared between workers.
+    if flat:
+        if _worker.flat_ydl is None:
+            _worker.flat_ydl = _worker.YoutubeDL(dict(_worker.options, extract_flat='in_playlist'))
+        ydl = _worker.flat_ydl
+    else:
+        ydl = _worker.ydl
+    info = ydl.extract_info(query, download=False)
+    return ydl.sanitize_info(info)
+
+
+class TrackResolver:
+    def __init__(self, ydl_options: Dict, max_workers: int = 4, use_processes: bool = False, timeout: float = 20.0):
+        self.ydl_options = ydl_options
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_cls(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.ydl_options,)
+            )
+        return self._executor
+
+    async def extract(self, query: str, timeout: Optional[float] = None, flat: bool = False) -> Dict:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), _extract, query, flat)
+        started = loop.time()
+        result = "error"
+        try:
+            # Cancelling the awaiting task (or hitting the timeout) also cancels
+            # the job if it has not been picked up by a worker yet.
+            info = await asyncio.wait_for(future, timeout or self.timeout)
+            result = "ok"
+            return info
+        except asyncio.TimeoutError:
+            result = "timeout"
+            raise ValueError(f"Track retrieval timed out after {timeout or self.timeout:.0f}s")
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        finally:
+            EXTRACTION_SECONDS.observe(loop.time() - started, mode="flat" if flat else "full", result=result)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
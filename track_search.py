@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from track_resolver import TrackResolver
+
+
+class SearchEngine:
+    def __init__(self, resolver: TrackResolver, ttl: float = 600, memory_size: int = 128):
+        self.resolver = resolver
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._results: OrderedDict = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _to_result(entry: Dict) -> Dict:
+        thumbnail = entry.get('thumbnail')
+        if not thumbnail and entry.get('thumbnails'):
+            thumbnail = entry['thumbnails'][-1].get('url')
+        return {
+            'id': entry.get('id'),
+            'title': entry.get('title', 'Unknown Track'),
+            'webpage_url': entry.get('webpage_url') or entry.get('url'),
+            'duration': entry.get('duration'),
+            'thumbnail': thumbnail,
+            'uploader': entry.get('uploader') or entry.get('channel'),
+        }
+
+    async def search(self, query: str, limit: int = 5) -> List[Dict]:
+        key = (self.normalize_query(query), limit)
+        cached = self._results.get(key)
+        if cached is not None and cached[1] > time.time():
+            self._results.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached[0]
+
+        # Flat extraction only reads the search page, without resolving formats
+        # for every hit, so it is a fraction of the cost of a full extraction.
+        self.stats['misses'] += 1
+        info = await self.resolver.extract(f"ytsearch{limit}:{query}", flat=True)
+        results = [self._to_result(entry) for entry in info.get('entries') or [] if entry]
+
+        self._results[key] = (results, time.time() + self.ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.memory_size:
+            self._results.popitem(last=False)
+        return results